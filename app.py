@@ -1,76 +1,28 @@
-from fastapi import FastAPI, Request
-from fastapi.middleware.cors import CORSMiddleware
+import asyncio
+
 from fastapi.responses import Response
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-from starlette.responses import HTMLResponse, RedirectResponse
 from uvicorn import run as app_run
 
-from typing import Optional
-
 from us_visa.constants.constant import APP_HOST, APP_PORT
-from us_visa.pipeline.training_pipeline import TrainingPipeline
-from us_visa.pipeline.prediction_pipeline import USvisaData,USvisaClassifier
-from dotenv import load_dotenv
-# 
-load_dotenv()
-app = FastAPI()
-
-app.mount("/static", StaticFiles(directory="static"), name="static")
-
-templates = Jinja2Templates(directory='templates')
-
-origins = ["*"]
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-class DataForm:
-    def __init__(self, request: Request):
-        self.request: Request = request
-        self.continent: Optional[str] = None
-        self.education_of_employee: Optional[str] = None
-        self.has_job_experience: Optional[str] = None
-        self.requires_job_training: Optional[str] = None
-        self.no_of_employees: Optional[str] = None
-        self.company_age: Optional[str] = None
-        self.region_of_employment: Optional[str] = None
-        self.prevailing_wage: Optional[str] = None
-        self.unit_of_wage: Optional[str] = None
-        self.full_time_position: Optional[str] = None
-        
-
-    async def get_usvisa_data(self):
-        form = await self.request.form()
-        self.continent = form.get("continent")
-        self.education_of_employee = form.get("education_of_employee")
-        self.has_job_experience = form.get("has_job_experience")
-        self.requires_job_training = form.get("requires_job_training")
-        self.no_of_employees = form.get("no_of_employees")
-        self.company_age = form.get("company_age")
-        self.region_of_employment = form.get("region_of_employment")
-        self.prevailing_wage = form.get("prevailing_wage")
-        self.unit_of_wage = form.get("unit_of_wage")
-        self.full_time_position = form.get("full_time_position")
-
-@app.get("/", tags=["authentication"])
-async def index(request: Request):
+from serve import app, reload_model, start_warm_up, warm_up_model
 
-    return templates.TemplateResponse(
-            "usvisa.html",{"request": request, "context": "Rendering"})
+# serve.py holds the prediction routes and only needs the model runtime,
+# this entry point adds /train on top of it
 
 
 @app.get("/train")
 async def trainRouteClient():
     try:
+        # the training stack (evidently, imblearn, grid search) is imported on the first retrain only
+        from us_visa.pipeline.training_pipeline import TrainingPipeline
+
         train_pipeline = TrainingPipeline()
 
         train_pipeline.run_pipeline()
+        reload_model()
+        # a failed warm-up keeps retrying in the background, /ready stays 503 until the new model is warm
+        if not await asyncio.get_running_loop().run_in_executor(None, warm_up_model):
+            start_warm_up()
 
         return Response("Training successful !!")
 
@@ -78,45 +30,5 @@ async def trainRouteClient():
         return Response(f"Error Occurred! {e}")
 
 
-@app.post("/")
-async def predictRouteClient(request: Request):
-    try:
-        form = DataForm(request)
-        await form.get_usvisa_data()
-        
-        usvisa_data = USvisaData(
-                                continent= form.continent,
-                                education_of_employee = form.education_of_employee,
-                                has_job_experience = form.has_job_experience,
-                                requires_job_training = form.requires_job_training,
-                                no_of_employees= form.no_of_employees,
-                                company_age= form.company_age,
-                                region_of_employment = form.region_of_employment,
-                                prevailing_wage= form.prevailing_wage,
-                                unit_of_wage= form.unit_of_wage,
-                                full_time_position= form.full_time_position,
-                                )
-        
-        usvisa_df = usvisa_data.get_usvisa_input_data_frame()
-
-        model_predictor = USvisaClassifier()
-
-        value = model_predictor.predict(dataframe=usvisa_df)[0]
-
-        status = None
-        if value == 1:
-            status = "Visa-approved"
-        else:
-            status = "Visa Not-Approved"
-
-        return templates.TemplateResponse(
-            "usvisa.html",
-            {"request": request, "context": status},
-        )
-        
-    except Exception as e:
-        return {"status": False, "error": f"{e}"}
-
-
 if __name__ == "__main__":
-    app_run(app, host=APP_HOST, port=APP_PORT)
\ No newline at end of file
+    app_run(app, host=APP_HOST, port=APP_PORT)
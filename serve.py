@@ -0,0 +1,270 @@
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.staticfiles import StaticFiles
+from fastapi.templating import Jinja2Templates
+from starlette.responses import JSONResponse, Response
+from uvicorn import run as app_run
+
+from typing import Optional
+
+from us_visa.constants.constant import APP_HOST, APP_PORT
+from us_visa.pipeline.prediction_pipeline import USvisaData,USvisaClassifier
+from us_visa.pipeline.prediction_batcher import PredictionBatcher
+from us_visa.pipeline.request_codec import decode_request, encode_response, negotiate
+from us_visa.entity.feature_spec import load_feature_spec
+from us_visa.monitoring.drift_monitor import DriftMonitor
+from us_visa.monitoring.prediction_log import PredictionLogSink
+from us_visa.logger.logger import logging
+from dotenv import load_dotenv
+# 
+load_dotenv()
+
+model_predictor = USvisaClassifier()
+prediction_batcher = None
+if model_predictor.prediction_pipeline_config.batch_enabled:
+    prediction_batcher = PredictionBatcher(predict_fn=model_predictor.predict,
+                                           max_batch_size=model_predictor.prediction_pipeline_config.batch_max_size,
+                                           window_ms=model_predictor.prediction_pipeline_config.batch_window_ms)
+drift_monitor = DriftMonitor()
+prediction_log = PredictionLogSink()
+
+readiness = {"ready": False, "model_version": None, "warmup_seconds": None, "error": None}
+# bumped by every reload, a warm-up that started on the previous model does not mark the server ready
+model_generation = 0
+warmup_lock = threading.Lock()
+warmup_stopped = threading.Event()
+warmup_thread: Optional[threading.Thread] = None
+
+
+def warm_up_model() -> bool:
+    '''
+    One warm-up attempt, the server is marked ready only when it succeeds on the current model
+    '''
+    generation = model_generation
+    try:
+        warmup_seconds = round(model_predictor.warm_up(),3)
+        reference_profile = model_predictor.get_reference_profile()
+        model_version = model_predictor.get_estimator().model_version
+    except Exception as e:
+        logging.info(f"Model warm-up failed: {e}")
+        readiness["error"] = str(e)
+        return False
+
+    with warmup_lock:
+        if generation != model_generation:
+            return False
+        drift_monitor.set_reference(reference_profile)
+        readiness.update(ready=True, model_version=model_version, warmup_seconds=warmup_seconds, error=None)
+    return True
+
+
+def warm_up_until_ready() -> None:
+    '''
+    Retries the warm-up with exponential backoff until it succeeds or the server stops,
+    so a transient storage error does not leave /ready failing while /live reports the process alive
+    '''
+    delay = model_predictor.prediction_pipeline_config.warmup_retry_initial_seconds
+    while not warm_up_model():
+        logging.info(f"Retrying model warm-up in {delay:.1f}s")
+        if warmup_stopped.wait(delay):
+            return
+        delay = min(2 * delay, model_predictor.prediction_pipeline_config.warmup_retry_max_seconds)
+
+
+def start_warm_up() -> None:
+    '''
+    Warms the model up on a background thread unless a warm-up is already retrying
+    '''
+    global warmup_thread
+    with warmup_lock:
+        if warmup_thread is None or not warmup_thread.is_alive():
+            warmup_thread = threading.Thread(target=warm_up_until_ready, name="model-warmup", daemon=True)
+            warmup_thread.start()
+
+
+def reload_model() -> None:
+    '''
+    Drops the served model, /ready reports 503 until the next one has warmed up
+    '''
+    global model_generation
+    with warmup_lock:
+        model_generation += 1
+        readiness.update(ready=False, model_version=None, warmup_seconds=None)
+        model_predictor.reload_model()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    prediction_log.start()
+    # warm-up runs next to the server so /live answers at once while /ready waits for a warm model
+    start_warm_up()
+    yield
+    warmup_stopped.set()
+    if warmup_thread is not None:
+        await asyncio.get_running_loop().run_in_executor(None, warmup_thread.join)
+    await asyncio.get_running_loop().run_in_executor(None, prediction_log.close)
+
+
+app = FastAPI(lifespan=lifespan)
+
+app.mount("/static", StaticFiles(directory="static"), name="static")
+
+templates = Jinja2Templates(directory='templates')
+
+origins = ["*"]
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=origins,
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+class DataForm:
+    def __init__(self, request: Request):
+        self.request: Request = request
+        self.continent: Optional[str] = None
+        self.education_of_employee: Optional[str] = None
+        self.has_job_experience: Optional[str] = None
+        self.requires_job_training: Optional[str] = None
+        self.no_of_employees: Optional[str] = None
+        self.company_age: Optional[str] = None
+        self.region_of_employment: Optional[str] = None
+        self.prevailing_wage: Optional[str] = None
+        self.unit_of_wage: Optional[str] = None
+        self.full_time_position: Optional[str] = None
+        
+
+    async def get_usvisa_data(self):
+        form = await self.request.form()
+        self.continent = form.get("continent")
+        self.education_of_employee = form.get("education_of_employee")
+        self.has_job_experience = form.get("has_job_experience")
+        self.requires_job_training = form.get("requires_job_training")
+        self.no_of_employees = form.get("no_of_employees")
+        self.company_age = form.get("company_age")
+        self.region_of_employment = form.get("region_of_employment")
+        self.prevailing_wage = form.get("prevailing_wage")
+        self.unit_of_wage = form.get("unit_of_wage")
+        self.full_time_position = form.get("full_time_position")
+
+@app.get("/", tags=["authentication"])
+async def index(request: Request):
+
+    return templates.TemplateResponse(
+            "usvisa.html",{"request": request, "context": "Rendering"})
+
+
+async def predict_columnar(request: Request, request_media_type: str, response_media_type: str) -> Response:
+    '''
+    Scores a columnar batch sent as json, arrow or msgpack and answers in the negotiated format
+    '''
+    # shaped once here, the classifier's own feature spec pass is then a no-op
+    usvisa_df = load_feature_spec().transform(decode_request(await request.body(), request_media_type))
+
+    start = time.perf_counter()
+    if prediction_batcher is not None:
+        predictions = await prediction_batcher.predict(usvisa_df)
+    else:
+        predictions = await asyncio.get_running_loop().run_in_executor(None, model_predictor.predict, usvisa_df)
+    latency_ms = (time.perf_counter() - start) * 1000
+
+    prediction_log.log(usvisa_df, predictions, model_predictor.get_estimator().model_version, latency_ms)
+    drift_monitor.update_batch(usvisa_df)
+    return Response(content=encode_response(predictions, response_media_type), media_type=response_media_type)
+
+
+@app.post("/")
+async def predictRouteClient(request: Request):
+    try:
+        # form posts render the page, json / arrow / msgpack bodies are scored as columnar batches
+        request_media_type, response_media_type = negotiate(request.headers.get("content-type"),
+                                                            request.headers.get("accept"))
+        if request_media_type is not None:
+            return await predict_columnar(request, request_media_type, response_media_type)
+
+        form = DataForm(request)
+        await form.get_usvisa_data()
+        
+        usvisa_data = USvisaData(
+                                continent= form.continent,
+                                education_of_employee = form.education_of_employee,
+                                has_job_experience = form.has_job_experience,
+                                requires_job_training = form.requires_job_training,
+                                no_of_employees= form.no_of_employees,
+                                company_age= form.company_age,
+                                region_of_employment = form.region_of_employment,
+                                prevailing_wage= form.prevailing_wage,
+                                unit_of_wage= form.unit_of_wage,
+                                full_time_position= form.full_time_position,
+                                )
+        
+        usvisa_df = usvisa_data.get_usvisa_input_data_frame()
+
+        start = time.perf_counter()
+        if prediction_batcher is not None:
+            value = (await prediction_batcher.predict(usvisa_df))[0]
+        else:
+            value = (await asyncio.get_running_loop().run_in_executor(None, model_predictor.predict, usvisa_df))[0]
+        latency_ms = (time.perf_counter() - start) * 1000
+
+        prediction_log.log(usvisa_df, [value], model_predictor.get_estimator().model_version, latency_ms)
+        drift_monitor.update({column: values[0] for column,values in usvisa_data.get_usvisa_data_as_dict().items()})
+
+        status = None
+        if value == 1:
+            status = "Visa-approved"
+        else:
+            status = "Visa Not-Approved"
+
+        return templates.TemplateResponse(
+            "usvisa.html",
+            {"request": request, "context": status},
+        )
+        
+    except Exception as e:
+        return {"status": False, "error": f"{e}"}
+
+
+@app.get("/live")
+async def liveRouteClient():
+    return {"status": "alive"}
+
+
+@app.get("/ready")
+async def readyRouteClient():
+    return JSONResponse(status_code=200 if readiness["ready"] else 503, content=readiness)
+
+
+@app.get("/drift")
+async def driftRouteClient():
+    return drift_monitor.get_drift_report()
+
+
+@app.get("/cache")
+async def cacheRouteClient():
+    if model_predictor.prediction_cache is None:
+        return {"status": "prediction cache disabled"}
+    return model_predictor.prediction_cache.get_stats()
+
+
+@app.get("/prediction-log")
+async def predictionLogRouteClient():
+    return prediction_log.get_stats()
+
+
+@app.get("/batching")
+async def batchingRouteClient():
+    if prediction_batcher is None:
+        return {"status": "prediction batching disabled"}
+    return prediction_batcher.get_stats()
+
+
+if __name__ == "__main__":
+    app_run(app, host=APP_HOST, port=APP_PORT)
\ No newline at end of file
@@ -1,5 +1,6 @@
 import boto3
 from us_visa.configuration.aws_connection import S3Client
+from us_visa.cloud_storage.storage_backend import StorageBackend
 from io import StringIO
 from typing import Union,List
 import os,sys
@@ -11,7 +12,7 @@ from pandas import DataFrame,read_csv
 import pickle
 
 
-class SimpleStorageService:
+class SimpleStorageService(StorageBackend):
 
     def __init__(self):
         s3_client = S3Client()
@@ -32,8 +33,16 @@ class SimpleStorageService:
                 return False
         except Exception as e:
             raise USvisaException(e,sys)
-        
-        
+
+    def key_path_available(self,bucket_name: str,key: str) -> bool:
+        return self.s3_key_path_available(bucket_name=bucket_name,s3_key=key)
+
+    def get_object_version(self,key: str,bucket_name: str) -> str:
+        # the ETag changes with every upload of the key
+        return self.get_file_object(key,bucket_name).e_tag.strip('"')
+
+    def read_file(self,key: str,bucket_name: str) -> bytes:
+        return self.read_object(self.get_file_object(key,bucket_name),decode=False)
 
     @staticmethod
     def read_object(object_name: str, decode: bool = True, make_readable: bool = False) -> Union[StringIO, str]:
@@ -202,6 +211,23 @@ class SimpleStorageService:
         except Exception as e:
             raise USvisaException(e, sys) from e
 
+    def delete_file(self, filename: str, bucket_name: str) -> None:
+        """
+        Method Name :   delete_file
+        Description :   This method deletes the filename object from bucket_name bucket, a missing object is not an error
+
+        Output      :   Object is removed from s3 bucket
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        logging.info("Entered the delete_file method of S3Operations class")
+
+        try:
+            self.s3_resource.Object(bucket_name, filename).delete()
+            logging.info(f"Deleted {filename} file from {bucket_name} bucket")
+
+        except Exception as e:
+            raise USvisaException(e, sys) from e
+
     def upload_df_as_csv(self,data_frame: DataFrame,local_filename: str, bucket_filename: str,bucket_name: str,) -> None:
         """
         Method Name :   upload_df_as_csv
@@ -0,0 +1,91 @@
+import os
+import sys
+import pickle
+import shutil
+import tempfile
+
+from us_visa.cloud_storage.storage_backend import StorageBackend
+from us_visa.exception.exceptions import USvisaException
+from us_visa.logger.logger import logging
+
+
+class LocalStorageService(StorageBackend):
+    '''
+    Model registry on a local or mounted volume, a bucket is a directory under root_dir.
+    Files are published by writing a temporary file next to the target and renaming it over the target,
+    so a reader sees either the old or the new file
+    '''
+
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+
+    def get_path(self, key: str, bucket_name: str) -> str:
+        return os.path.join(self.root_dir, bucket_name, key)
+
+    def key_path_available(self, bucket_name: str, key: str) -> bool:
+        return os.path.exists(self.get_path(key, bucket_name))
+
+    def get_object_version(self, key: str, bucket_name: str) -> str:
+        try:
+            # a publish replaces the file, which changes the inode and the modification time
+            stat = os.stat(self.get_path(key, bucket_name))
+            return f"{stat.st_ino:x}-{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+        except Exception as e:
+            raise USvisaException(e, sys) from e
+
+    def read_file(self, key: str, bucket_name: str) -> bytes:
+        try:
+            # the open file keeps its content when a newer publish replaces the key
+            with open(self.get_path(key, bucket_name), "rb") as f:
+                return f.read()
+
+        except Exception as e:
+            raise USvisaException(e, sys) from e
+
+    def load_model(self, model_name: str, bucket_name: str, model_dir: str = None) -> object:
+        try:
+            model_file = model_name if model_dir is None else model_dir + "/" + model_name
+            model = pickle.loads(self.read_file(model_file, bucket_name))
+            logging.info(f"Loaded {model_file} from {self.root_dir}/{bucket_name}")
+            return model
+
+        except Exception as e:
+            raise USvisaException(e, sys) from e
+
+    def upload_file(self, from_filename: str, to_filename: str, bucket_name: str, remove: bool = True) -> None:
+        try:
+            target_path = self.get_path(to_filename, bucket_name)
+            target_dir = os.path.dirname(target_path)
+            os.makedirs(target_dir, exist_ok=True)
+
+            # the temporary file is on the target's filesystem, so the rename below is atomic
+            fd, temp_path = tempfile.mkstemp(dir=target_dir, prefix=".", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as temp_file, open(from_filename, "rb") as source_file:
+                    shutil.copyfileobj(source_file, temp_file, length=1 << 20)
+                    temp_file.flush()
+                    # mkstemp creates the file private, a serving process under another user must read it
+                    os.fchmod(temp_file.fileno(), 0o644)
+                    os.fsync(temp_file.fileno())
+                os.replace(temp_path, target_path)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+
+            logging.info(f"Published {from_filename} file to {target_path}")
+
+            if remove is True:
+                os.remove(from_filename)
+
+        except Exception as e:
+            raise USvisaException(e, sys) from e
+
+    def delete_file(self, filename: str, bucket_name: str) -> None:
+        try:
+            os.remove(self.get_path(filename, bucket_name))
+            logging.info(f"Deleted {filename} file from {self.root_dir}/{bucket_name}")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            raise USvisaException(e, sys) from e
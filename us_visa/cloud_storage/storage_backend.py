@@ -0,0 +1,64 @@
+from abc import ABC, abstractmethod
+
+from us_visa.entity.config_entity import StorageConfig
+
+
+class StorageBackend(ABC):
+    '''
+    Object storage the model registry is kept in: the estimator loads from it, the pusher publishes to it.
+    Keys live in buckets, a key's version changes with every publish of that key
+    '''
+
+    @abstractmethod
+    def key_path_available(self, bucket_name: str, key: str) -> bool:
+        '''
+        Returns True when anything is stored under key in bucket_name
+        '''
+
+    @abstractmethod
+    def get_object_version(self, key: str, bucket_name: str) -> str:
+        '''
+        Returns an identifier of the stored content of key that changes with every publish
+        '''
+
+    @abstractmethod
+    def read_file(self, key: str, bucket_name: str) -> bytes:
+        '''
+        Returns the content of key
+        '''
+
+    @abstractmethod
+    def load_model(self, model_name: str, bucket_name: str, model_dir: str = None) -> object:
+        '''
+        Unpickles the model stored under model_name
+        '''
+
+    @abstractmethod
+    def upload_file(self, from_filename: str, to_filename: str, bucket_name: str, remove: bool = True) -> None:
+        '''
+        Publishes the local file from_filename under to_filename, readers never see a partial file
+        '''
+
+    @abstractmethod
+    def delete_file(self, filename: str, bucket_name: str) -> None:
+        '''
+        Removes filename, a missing key is not an error
+        '''
+
+
+def get_storage_backend(storage_config: StorageConfig = None) -> StorageBackend:
+    '''
+    Returns the storage backend named by the storage config: s3 or local
+    '''
+    storage_config = storage_config or StorageConfig()
+
+    if storage_config.backend == "s3":
+        # boto3 is only imported when the registry is on s3
+        from us_visa.cloud_storage.aws_storage import SimpleStorageService
+        return SimpleStorageService()
+
+    if storage_config.backend == "local":
+        from us_visa.cloud_storage.local_storage import LocalStorageService
+        return LocalStorageService(root_dir=storage_config.local_root_dir)
+
+    raise ValueError(f"Unknown storage backend {storage_config.backend}, expected s3 or local")
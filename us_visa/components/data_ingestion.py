@@ -1,8 +1,14 @@
 import os 
 import sys 
+import shutil
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
 
-from pandas import DataFrame 
+import numpy as np
+from pandas import DataFrame, Series
 from sklearn.model_selection import train_test_split
+from pymongo.collection import Collection
 
 from us_visa.entity.config_entity import DataIngestionConfig
 from us_visa.entity.artifact_entity import DataIngestionArtifact
@@ -29,7 +35,8 @@ class DataIngestion:
         try:
             logging.info(f"Exporting data from mongodb")
             usvisa_data = UsVisaData()
-            visa_df = usvisa_data.export_collection_as_dataframe(collection_name=self.data_ingestion_config.collection_name)
+            visa_df = usvisa_data.export_collection_as_dataframe(collection_name=self.data_ingestion_config.collection_name,
+                                                                 n_partitions=self.data_ingestion_config.export_partitions)
             logging.info(f"Shape of visa_df loaded from mongodb:{visa_df.shape}")
 
             feature_store_file_path = self.data_ingestion_config.feature_store_file_path
@@ -71,6 +78,100 @@ class DataIngestion:
         except Exception as e:
             raise USvisaException(str(e),sys)
         
+    @staticmethod
+    def is_test_row(keys: Series,test_ratio: float) -> np.ndarray:
+        '''
+        Routes rows by the md5 of their split key: a key always lands on the same side,
+        whatever else is in the collection and in whichever batch it arrives
+        '''
+        buckets = np.fromiter((int.from_bytes(hashlib.md5(str(key).encode(),usedforsecurity=False).digest()[:8],"big")
+                               for key in keys),dtype=np.uint64,count=len(keys))
+        return buckets < np.uint64(test_ratio * 2**64)
+
+    def get_output_file_paths(self) -> List[str]:
+        return [self.data_ingestion_config.feature_store_file_path,
+                self.data_ingestion_config.training_file_path,
+                self.data_ingestion_config.testing_file_path]
+
+    def split_partition(self,usvisa_data: UsVisaData,collection: Collection,
+                        partition_number: int,bounds: Tuple[object,object]) -> Tuple[int,int]:
+        '''
+        Streams one _id range on its own cursor and appends its batches to part files of the feature store,
+        train and test csv files, routing each row by the hash of its split key
+        '''
+        split_key = self.data_ingestion_config.split_key
+        part_paths = [f"{file_path}.part{partition_number}" for file_path in self.get_output_file_paths()]
+        batches = usvisa_data.read_partition_in_batches(collection,bounds,
+                                                        batch_size=self.data_ingestion_config.stream_batch_size,
+                                                        extra_columns=(split_key,))
+        n_train = n_test = 0
+        for batch_number,batch in enumerate(batches):
+            test_mask = self.is_test_row(batch[split_key],self.data_ingestion_config.train_test_split_ratio)
+            batch = batch.drop(columns=[split_key])
+
+            # batches come on the full export column list, so every batch appends under the first header
+            write_options = {"mode": "w","header": True} if batch_number == 0 else {"mode": "a","header": False}
+            for part_path,rows in zip(part_paths,(batch,batch[~test_mask],batch[test_mask])):
+                rows.to_csv(part_path,index=False,**write_options)
+
+            n_test += int(test_mask.sum())
+            n_train += len(batch) - int(test_mask.sum())
+
+        return n_train,n_test
+
+    def merge_partition_files(self,n_partitions: int) -> None:
+        '''
+        Concatenates the part files in _id range order into the output files, keeping the first header only
+        '''
+        for file_path in self.get_output_file_paths():
+            with open(file_path,"wb") as output_file:
+                header_written = False
+                for partition_number in range(n_partitions):
+                    part_path = f"{file_path}.part{partition_number}"
+                    if not os.path.exists(part_path):
+                        continue
+                    with open(part_path,"rb") as part_file:
+                        header = part_file.readline()
+                        if not header_written:
+                            output_file.write(header)
+                            header_written = True
+                        shutil.copyfileobj(part_file,output_file,length=1 << 20)
+                    os.remove(part_path)
+
+    def stream_split_by_key(self) -> None:
+        '''
+        This method streams the collection from mongodb as _id range partitions read concurrently, one cursor each,
+        and writes the feature store, train and test csv files batch by batch, routing each row by the hash of its split key
+
+        Output: feature store, train and test files are written batch by batch
+        On Failure: Write an exception log and then raise the exception
+        '''
+        try:
+            for file_path in self.get_output_file_paths():
+                os.makedirs(os.path.dirname(file_path),exist_ok=True)
+
+            usvisa_data = UsVisaData()
+            collection = usvisa_data.get_collection(self.data_ingestion_config.collection_name)
+            n_partitions = self.data_ingestion_config.export_partitions
+            bounds = usvisa_data.get_partition_bounds(collection,n_partitions) if n_partitions > 1 else [(None,None)]
+            logging.info(f"Streaming {self.data_ingestion_config.collection_name} as {len(bounds)} _id range partitions")
+
+            with ThreadPoolExecutor(max_workers=len(bounds)) as executor:
+                counts = list(executor.map(lambda partition: self.split_partition(usvisa_data,collection,*partition),
+                                           enumerate(bounds)))
+            self.merge_partition_files(len(bounds))
+
+            n_train = sum(n for n,_ in counts)
+            n_test = sum(n for _,n in counts)
+            if n_train + n_test == 0:
+                raise Exception(f"Collection {self.data_ingestion_config.collection_name} returned no rows")
+
+            logging.info(f"Streamed {n_train + n_test} rows split by {self.data_ingestion_config.split_key} hash: "
+                         f"{n_train} train, {n_test} test")
+
+        except Exception as e:
+            raise USvisaException(str(e),sys)
+
     def initiate_data_ingestion(self) -> DataIngestionArtifact:
         '''
         This method initiates data ingestion components of the training pipeline 
@@ -81,11 +182,15 @@ class DataIngestion:
         '''
 
         try:
-            visa_df = self.export_data_into_feature_store()
-            logging.info("Retrieved the data from MongoDB")
+            if self.data_ingestion_config.split_mode == "hash":
+                self.stream_split_by_key()
+                logging.info("Streamed the data from MongoDB into the train and test sets")
+            else:
+                visa_df = self.export_data_into_feature_store()
+                logging.info("Retrieved the data from MongoDB")
 
-            self.split_data_as_train_test(visa_df)
-            logging.info("Performed train test split on dataset")
+                self.split_data_as_train_test(visa_df)
+                logging.info("Performed train test split on dataset")
 
             data_ingestion_artifact  = DataIngestionArtifact(trained_file_path=self.data_ingestion_config.training_file_path,
                                                              test_file_path=self.data_ingestion_config.testing_file_path)
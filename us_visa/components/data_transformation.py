@@ -1,9 +1,17 @@
+import os
 import sys 
+import time
+from concurrent.futures import Future
+from typing import Callable
 
 import numpy as np 
 import pandas as pd 
 
 from imblearn.combine import SMOTEENN
+from imblearn.over_sampling import SMOTE,RandomOverSampler
+from imblearn.under_sampling import EditedNearestNeighbours,RandomUnderSampler
+from sklearn.neighbors import NearestNeighbors
+from scipy import sparse
 
 from sklearn.preprocessing import (StandardScaler,
                                    OrdinalEncoder,
@@ -12,7 +20,7 @@ from sklearn.preprocessing import (StandardScaler,
 from sklearn.pipeline import Pipeline 
 from sklearn.compose import ColumnTransformer 
 
-from us_visa.constants.constant import TARGET_COLUMN,SCHEMA_FILE_PATH,CURRENT_YEAR
+from us_visa.constants.constant import TARGET_COLUMN,SCHEMA_FILE_PATH
 from us_visa.entity.config_entity import DataTransformationConfig
 from us_visa.entity.artifact_entity import (DataIngestionArtifact,
                                             DataTransformationArtifact,
@@ -21,21 +29,28 @@ from us_visa.exception.exceptions import USvisaException
 from us_visa.logger.logger import logging 
 from us_visa.utils.main_utils import (save_object,
                                       save_numpy_array_data,
-                                      read_yaml_file,
-                                      drop_columns)
+                                      save_sparse_array_data,
+                                      read_yaml_file)
 from us_visa.entity.estimator import TargetValueMapping
+from us_visa.entity.feature_spec import FeatureSpec
+from us_visa.monitoring.drift_monitor import build_reference_profile
+from us_visa.pipeline.stage_graph import run_inline
 
 
 class DataTransformation:
     def __init__(self,
                  data_ingestion_artifact: DataIngestionArtifact,
                  data_transformation_config: DataTransformationConfig,
-                 data_validation_artifact: DataValidationArtifact):
+                 data_validation_artifact: DataValidationArtifact,
+                 background: Callable[...,Future] = run_inline):
         try:
             self.data_ingestion_artifact = data_ingestion_artifact
             self.data_transformation_config = data_transformation_config
             self.data_validation_artifact = data_validation_artifact
+            self.background = background
             self._schema_config = read_yaml_file(file_path=SCHEMA_FILE_PATH)
+            self._feature_spec = FeatureSpec.from_schema(self._schema_config)
+            self._resampling_config = read_yaml_file(file_path=data_transformation_config.model_config_file_path).get("resampling",{})
         
         except Exception as e:
             raise USvisaException(str(e),sys)
@@ -59,8 +74,10 @@ class DataTransformation:
         try:
             logging.info("Got the numerical columns from schema_config file")
 
+            sparse_output = self.data_transformation_config.sparse_output
+
             numeric_transformer = StandardScaler()
-            oh_transformer = OneHotEncoder(drop='first',sparse_output=False)
+            oh_transformer = OneHotEncoder(drop='first',sparse_output=sparse_output)
             ordinal_encoder = OrdinalEncoder()
 
             logging.info("Initialized std scaler,one hot encoder and ord encoder objects")
@@ -81,7 +98,7 @@ class DataTransformation:
                 ("OrdinalEncoder",ordinal_encoder,or_columns),
                 ("Transformer",transform_pipe,transform_columns),
                 ("StandardScaler",numeric_transformer,num_features)
-            ])
+            ],sparse_threshold=1.0 if sparse_output else 0.0)
 
             logging.info("Created preprocessing object")
             return preprocessor
@@ -89,6 +106,107 @@ class DataTransformation:
         except Exception as e:
             raise USvisaException(str(e),sys) 
     
+    def get_resampler(self) -> object:
+        '''
+        This method creates the class imbalance resampler selected in the resampling section of model.yaml
+        
+        Output      :   imblearn sampler, or None when the strategy does not resample
+        On Failure  :   Write an exception log and then raise an exception
+        '''
+        try:
+            config = self._resampling_config
+            strategy = config.get("strategy","smoteenn")
+            sampling_strategy = config.get("sampling_strategy","minority")
+            random_state = config.get("random_state")
+            n_jobs = config.get("n_jobs")
+
+            # the neighbour searches are handed a NearestNeighbors with n_jobs so they run in parallel
+            if strategy in ("smoteenn","smote"):
+                smote = SMOTE(sampling_strategy=sampling_strategy,
+                              random_state=random_state,
+                              k_neighbors=NearestNeighbors(n_neighbors=config.get("k_neighbors",5) + 1,
+                                                           n_jobs=n_jobs))
+                if strategy == "smote":
+                    return smote
+                
+                enn = EditedNearestNeighbours(sampling_strategy="all",
+                                              n_neighbors=NearestNeighbors(n_neighbors=config.get("enn_n_neighbors",3) + 1,
+                                                                           n_jobs=n_jobs))
+                return SMOTEENN(smote=smote,enn=enn,random_state=random_state)
+            
+            if strategy == "random_under":
+                return RandomUnderSampler(sampling_strategy="majority" if sampling_strategy == "minority" else sampling_strategy,
+                                          random_state=random_state)
+            
+            if strategy == "random_over":
+                return RandomOverSampler(sampling_strategy=sampling_strategy,random_state=random_state)
+            
+            if strategy in ("class_weight","none"):
+                return None
+            
+            raise ValueError(f"Unknown resampling strategy: {strategy}")
+        
+        except Exception as e:
+            raise USvisaException(str(e),sys)
+
+    def resample(self,resampler: object,features: np.ndarray,target: pd.Series,dataset_name: str):
+        '''
+        This method applies the resampler and logs how long the selected strategy took
+        
+        Output      :   resampled features and target
+        On Failure  :   Write an exception log and then raise an exception
+        '''
+        try:
+            if resampler is None:
+                return features,target
+            
+            start = time.perf_counter()
+            features_resampled,target_resampled = resampler.fit_resample(features,target)
+            logging.info(f"Resampled {dataset_name} dataset with {type(resampler).__name__} in "
+                         f"{time.perf_counter() - start:.3f}s: {len(target)} -> {len(target_resampled)} rows")
+            
+            return features_resampled,target_resampled
+        
+        except Exception as e:
+            raise USvisaException(str(e),sys)
+
+    def save_feature_array(self,file_path: str,array) -> str:
+        '''
+        This method saves transformed features as csr .npz in sparse mode and as .npy otherwise
+        
+        Output      :   path the features were written to
+        On Failure  :   Write an exception log and then raise an exception
+        '''
+        try:
+            if sparse.issparse(array):
+                file_path = os.path.splitext(file_path)[0] + ".npz"
+                save_sparse_array_data(file_path,array=array,dtype=self.data_transformation_config.feature_dtype)
+            else:
+                save_numpy_array_data(file_path,array=array,dtype=self.data_transformation_config.feature_dtype)
+            
+            return file_path
+        
+        except Exception as e:
+            raise USvisaException(str(e),sys)
+
+    def save_reference_profile(self,input_feature_train_df: pd.DataFrame) -> str:
+        '''
+        Profiles the raw training features for online drift monitoring and saves the profile
+        '''
+        try:
+            reference_profile = build_reference_profile(
+                df=input_feature_train_df,
+                categorical_columns=self._schema_config["oh_columns"] + self._schema_config["or_columns"],
+                numerical_columns=self._schema_config["num_features"],
+                n_bins=self.data_transformation_config.reference_profile_num_bins
+            )
+            save_object(self.data_transformation_config.reference_profile_file_path, reference_profile)
+            logging.info("Saved reference profile of the training features for online drift monitoring")
+            return self.data_transformation_config.reference_profile_file_path
+
+        except Exception as e:
+            raise USvisaException(str(e),sys)
+
     def initiate_data_transformation(self) -> DataTransformationArtifact:
 
         '''
@@ -104,21 +222,17 @@ class DataTransformation:
 
                 logging.info("Created the preprocessor pipeline object for data transformation")
 
-                train_df = DataTransformation.read_data(file_path=self.data_ingestion_artifact.trained_file_path)
-                test_df = DataTransformation.read_data(file_path=self.data_ingestion_artifact.test_file_path)
+                # the feature spec derives, drops and casts in one pass, a no-op for columns the export already shaped
+                train_df = self._feature_spec.transform(DataTransformation.read_data(file_path=self.data_ingestion_artifact.trained_file_path))
+                test_df = self._feature_spec.transform(DataTransformation.read_data(file_path=self.data_ingestion_artifact.test_file_path))
 
                 input_feature_train_df = train_df.drop(columns=[TARGET_COLUMN],axis=1)
                 target_feature_train_df = train_df[TARGET_COLUMN]
 
                 logging.info("Created the train features and test features of training dataset")
-                
-                input_feature_train_df['company_age'] = CURRENT_YEAR - input_feature_train_df['yr_of_estab']
-                logging.info("Created new feature called company_age")
 
-                drop_cols = self._schema_config["drop_columns"]
-                logging.info(f"Dropping columns {drop_cols} from the train dataset")
-
-                input_feature_train_df = drop_columns(df=input_feature_train_df,cols=drop_cols)
+                # profiling reads the raw frame only, it runs while the preprocessor is fitted and the data resampled
+                reference_profile_future = self.background(self.save_reference_profile,input_feature_train_df)
 
                 mapping = TargetValueMapping()._asdict()
 
@@ -131,12 +245,6 @@ class DataTransformation:
                 input_feature_test_df =  test_df.drop(columns=[TARGET_COLUMN],axis=1)
                 target_feature_test_df = test_df[TARGET_COLUMN]
 
-                input_feature_test_df['company_age'] = CURRENT_YEAR - input_feature_test_df['yr_of_estab']
-                logging.info("Created new feature company_age in test dataset")
-
-                input_feature_test_df = drop_columns(df=input_feature_test_df,cols=drop_cols)
-                logging.info(f"Dropping columns {drop_cols} from the test dataset")
-
                 target_feature_test_df = (
                     target_feature_test_df
                     .map(mapping)
@@ -151,32 +259,48 @@ class DataTransformation:
                 input_feature_test_arr =  preprocessor.transform(input_feature_test_df)
                 logging.info("Transformed the training and testing dataset")
 
-                logging.info("Applying SMOTEENN on training and testing dataset to handle the class imbalance")
-                smt = SMOTEENN(sampling_strategy='minority')
-
-                input_feature_train_final,target_feature_train_final = smt.fit_resample(input_feature_train_arr,
-                                                                                        target_feature_train_df)
-                
-                input_feature_test_final,target_feature_test_final = smt.fit_resample(input_feature_test_arr,
-                                                                                      target_feature_test_df)
-                logging.info("Creating train array and test array")
+                resampler = self.get_resampler()
+                logging.info(f"Handling the class imbalance with strategy {self._resampling_config.get('strategy','smoteenn')}")
 
-                train_arr = np.c_[input_feature_train_final,
-                                  np.array(target_feature_train_final)]
+                input_feature_train_final,target_feature_train_final = self.resample(resampler,
+                                                                                     input_feature_train_arr,
+                                                                                     target_feature_train_df,
+                                                                                     dataset_name="training")
                 
-                test_arr = np.c_[input_feature_test_final,
-                                 np.array(target_feature_test_final)]
+                if self._resampling_config.get("resample_test",False):
+                    input_feature_test_final,target_feature_test_final = self.resample(resampler,
+                                                                                       input_feature_test_arr,
+                                                                                       target_feature_test_df,
+                                                                                       dataset_name="testing")
+                else:
+                    input_feature_test_final,target_feature_test_final = input_feature_test_arr,target_feature_test_df
+                    
+                logging.info("Saving features and labels as separate compact arrays")
                 
                 save_object(self.data_transformation_config.transformed_object_file_path, preprocessor)
-                save_numpy_array_data(self.data_transformation_config.transformed_train_file_path, array=train_arr)
-                save_numpy_array_data(self.data_transformation_config.transformed_test_file_path, array=test_arr)
+                transformed_train_file_path = self.save_feature_array(self.data_transformation_config.transformed_train_file_path,
+                                                                      array=input_feature_train_final)
+                save_numpy_array_data(self.data_transformation_config.transformed_train_label_file_path,
+                                      array=np.asarray(target_feature_train_final),
+                                      dtype=self.data_transformation_config.label_dtype)
+                transformed_test_file_path = self.save_feature_array(self.data_transformation_config.transformed_test_file_path,
+                                                                     array=input_feature_test_final)
+                save_numpy_array_data(self.data_transformation_config.transformed_test_label_file_path,
+                                      array=np.asarray(target_feature_test_final),
+                                      dtype=self.data_transformation_config.label_dtype)
+                os.makedirs(os.path.dirname(self.data_transformation_config.test_feature_file_path),exist_ok=True)
+                input_feature_test_df.to_csv(self.data_transformation_config.test_feature_file_path,index=False)
 
                 logging.info("Saved preprocessor object")
 
                 data_transformation_artifact = DataTransformationArtifact(
                     transformed_object_file_path=self.data_transformation_config.transformed_object_file_path,
-                    transformed_train_file_path=self.data_transformation_config.transformed_train_file_path,
-                    transformed_test_file_path=self.data_transformation_config.transformed_test_file_path
+                    transformed_train_file_path=transformed_train_file_path,
+                    transformed_test_file_path=transformed_test_file_path,
+                    transformed_train_label_file_path=self.data_transformation_config.transformed_train_label_file_path,
+                    transformed_test_label_file_path=self.data_transformation_config.transformed_test_label_file_path,
+                    reference_profile_file_path=reference_profile_future.result(),
+                    test_feature_file_path=self.data_transformation_config.test_feature_file_path
                 )
 
 
@@ -1,6 +1,8 @@
 import os 
 import sys 
 import json 
+from concurrent.futures import Future
+from typing import Callable, Tuple
 
 import pandas as pd 
 from pandas import DataFrame
@@ -12,24 +14,28 @@ from evidently.presets import DataDriftPreset,DataSummaryPreset
 
 from us_visa.exception.exceptions import USvisaException
 from us_visa.logger.logger import logging 
-from us_visa.utils.main_utils import  read_yaml_file,write_yaml_file
+from us_visa.utils.main_utils import  read_yaml_file,write_json_file
 from us_visa.entity.artifact_entity import DataIngestionArtifact,DataValidationArtifact
 from us_visa.entity.config_entity import DataValidationConfig
 from us_visa.constants.constant import SCHEMA_FILE_PATH
+from us_visa.pipeline.stage_graph import run_inline
 
 class DataValidation:
     def __init__(self,
                  data_ingestion_artifact: DataIngestionArtifact,
-                 data_validation_config: DataValidationConfig):
+                 data_validation_config: DataValidationConfig,
+                 background: Callable[...,Future] = run_inline):
         '''
         
         :param data_ingestion_artifact: Output of data ingestion stage that creates train.csv,test.csv 
         :param data_validation_config: configuration for data validation
+        :param background: runs work the validation result does not depend on, such as the full drift report write
         '''
 
         try:
             self.data_ingestion_artifact = data_ingestion_artifact
             self.data_validation_config = data_validation_config
+            self.background = background
             self._schema_config = read_yaml_file(file_path=SCHEMA_FILE_PATH)
         
         except Exception as e:
@@ -88,6 +94,127 @@ class DataValidation:
         except Exception as e:
             raise USvisaException(e,sys)
     
+    def validate_data_schema(self,file_path: str) -> Tuple[bool,str]:
+        """
+        This method streams the csv in chunks and checks dtypes, category domains, numeric ranges
+        and null rates against the schema in a single pass. Column and dtype errors stop the scan early
+        
+        Output      :   Returns validation status and the validation error message
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            validation_config = self._schema_config["validation"]
+            domains = self._schema_config.get("domains",{})
+            ranges = self._schema_config.get("ranges",{})
+            column_dtypes = {name: dtype 
+                             for column in self._schema_config["columns"] 
+                             for name,dtype in column.items()}
+
+            n_rows = 0 
+            null_counts = dict.fromkeys(column_dtypes,0)
+            violation_counts = dict.fromkeys(column_dtypes,0)
+
+            # everything is read as text so that dtype problems are counted here instead of failing the parser
+            reader = pd.read_csv(file_path,dtype=str,chunksize=validation_config["chunk_size"])
+
+            for chunk_number,chunk in enumerate(reader):
+                if chunk_number == 0:
+                    if not (self.validate_number_of_columns(visa_df=chunk) and self.is_column_exist(visa_df=chunk)):
+                        return False,f"Columns do not match the schema in {file_path}"
+
+                n_rows += len(chunk)
+
+                for column,dtype in column_dtypes.items():
+                    values = chunk[column]
+                    nulls = values.isna()
+                    null_counts[column] += int(nulls.sum())
+
+                    if dtype in ("int","float"):
+                        numeric = pd.to_numeric(values,errors="coerce")
+                        bad_dtype = numeric.isna() & ~nulls
+                        if dtype == "int":
+                            bad_dtype |= numeric.notna() & (numeric % 1 != 0)
+
+                        if bad_dtype.any():
+                            return False,(f"Column {column} has {int(bad_dtype.sum())} values that are not {dtype} "
+                                          f"in rows {n_rows - len(chunk)}-{n_rows} of {file_path}")
+
+                        if column in ranges:
+                            low = ranges[column].get("min")
+                            high = ranges[column].get("max")
+                            if low is not None:
+                                violation_counts[column] += int((numeric < low).sum())
+                            if high is not None:
+                                violation_counts[column] += int((numeric > high).sum())
+
+                    if column in domains:
+                        violation_counts[column] += int((~values.isin(domains[column]) & ~nulls).sum())
+
+            if n_rows == 0:
+                return False,f"No rows found in {file_path}"
+
+            errors = []
+            for column in column_dtypes:
+                null_rate = null_counts[column] / n_rows
+                violation_rate = violation_counts[column] / n_rows
+
+                if null_rate > validation_config["max_null_rate"]:
+                    errors.append(f"{column} null rate {null_rate:.2%}")
+                if violation_rate > validation_config["max_violation_rate"]:
+                    errors.append(f"{column} domain/range violation rate {violation_rate:.2%}")
+            
+            logging.info(f"Validated {n_rows} rows of {file_path}, "
+                         f"nulls:{ {c: n for c,n in null_counts.items() if n} } "
+                         f"violations:{ {c: n for c,n in violation_counts.items() if n} }")
+            
+            return len(errors) == 0,", ".join(errors)
+        
+        except Exception as e:
+            raise USvisaException(str(e),sys)
+
+    @staticmethod
+    def get_drift_summary(run_dict: dict) -> dict:
+        """
+        This method reduces the evidently run to the values the drift decision is based on
+        
+        Output      :   Returns dict with drifted count, share, threshold and per column scores
+        On Failure  :   Write an exception log and then raise an exception
+        """
+        try:
+            metrics = run_dict["metrics"]
+
+            drifted_columns_metric = next(
+                m for m in metrics 
+                if m['metric_name'].startswith("DriftedColumnsCount")
+            )
+
+            columns = {}
+            for m in metrics:
+                if not m["metric_name"].startswith("ValueDrift"):
+                    continue 
+                
+                method = m["config"]["method"]
+                threshold = m["config"]["threshold"]
+                score = m["value"]
+                # statistical tests report a p-value (drift below threshold), distances drift above it
+                drifted = score < threshold if "p_value" in method else score >= threshold
+                columns[m["config"]["column"]] = {"method": method,
+                                                  "threshold": threshold,
+                                                  "score": score,
+                                                  "drifted": bool(drifted)}
+
+            drifted_share = drifted_columns_metric["value"]["share"]
+            drifted_threshold = drifted_columns_metric["config"]["drift_share"]
+
+            return {"drift_detected": bool(drifted_share >= drifted_threshold),
+                    "drifted_count": int(drifted_columns_metric["value"]["count"]),
+                    "drifted_share": drifted_share,
+                    "drift_share_threshold": drifted_threshold,
+                    "columns": columns}
+        
+        except Exception as e:
+            raise USvisaException(str(e),sys)
+
     def detect_dataset_drift(self,reference_df: DataFrame,current_df: DataFrame) -> bool:
         """
         This method validates if drift is detected
@@ -118,29 +245,24 @@ class DataValidation:
                        reference_data=reference_dataset)
             
             run_dict = run.dict()
-            
-            write_yaml_file(file_path=self.data_validation_config.drift_report_file_path,
-                            content=run_dict)
-            
-            metrics = run_dict["metrics"]
-
-            drifted_columns_metric = next(
-                m for m in metrics 
-                if m['metric_name'].startswith("DriftedColumnsCount")
-            )
+            drift_summary = self.get_drift_summary(run_dict)
 
-            drifted_share = drifted_columns_metric["value"]["share"]
-            drifted_threshold = drifted_columns_metric["config"]["drift_share"]
-            drifted_count  = drifted_columns_metric["value"]["count"]
-
-            drift_status = drifted_share >= drifted_threshold
+            write_json_file(file_path=self.data_validation_config.drift_report_file_path,
+                            content=drift_summary)
+            
+            if self.data_validation_config.write_full_drift_report:
+                # serializing and compressing the full report is off the critical path of the pipeline
+                self.background(write_json_file,
+                                file_path=self.data_validation_config.drift_report_details_file_path,
+                                content=run_dict,
+                                compress=True)
+                logging.info(f"Saving full drift report to {self.data_validation_config.drift_report_details_file_path}")
 
-            # n_features = drift_result["number_of_columns"]
-            # n_drifted_features = drift_result["number_of_drifted_columns"]
-            # drift_status = drift_result["dataset_drift"]
+            drifted_share = drift_summary["drifted_share"]
+            drifted_threshold = drift_summary["drift_share_threshold"]
+            drifted_count  = drift_summary["drifted_count"]
 
-            # logging.info(f"{n_drifted_features}/{n_features} features drifed")
-            # logging.info(f"Dataset drift detected:{drift_status}")
+            drift_status = drift_summary["drift_detected"]
 
             logging.info(f"{int(drifted_count)} columns drifted"
                          f"({drifted_share:.2%}), threshold={drifted_threshold:.2%}")
@@ -163,31 +285,21 @@ class DataValidation:
         try:
             validation_error_msg = ""
             logging.info("Starting data validation")
-            train_df,test_df = (DataValidation.read_data(file_path=self.data_ingestion_artifact.trained_file_path),
-                                DataValidation.read_data(file_path=self.data_ingestion_artifact.test_file_path))
-            
-            status = self.validate_number_of_columns(visa_df=train_df)
-            logging.info(f"All required columns present in training dataframe:{status}")
-
-            if not status:
-                validation_error_msg += f"Columns are missing training dataframe"
-            status = self.validate_number_of_columns(visa_df=test_df)
-            
-            logging.info(f"All columns present in testing dataframe:{status}")
-            if not status:
-                validation_error_msg += f"Columns are missing in the testing dadtaframe"
-            
-            status = self.is_column_exist(visa_df=train_df)
-            if not status:
-                validation_error_msg += f"Columns are missing in training dataframe"
-            status = self.is_column_exist(visa_df=test_df)
 
-            if not status:
-                validation_error_msg += f"columns are missing in a dataframe"
+            for dataset_name,file_path in (("training",self.data_ingestion_artifact.trained_file_path),
+                                           ("testing",self.data_ingestion_artifact.test_file_path)):
+                status,error_msg = self.validate_data_schema(file_path=file_path)
+                logging.info(f"Schema validation of {dataset_name} dataframe passed:{status}")
+                
+                if not status:
+                    validation_error_msg += f"Schema validation failed for {dataset_name} dataframe: {error_msg}"
+                    break
             
             validation_status = len(validation_error_msg) == 0
             
             if validation_status:
+                train_df,test_df = (DataValidation.read_data(file_path=self.data_ingestion_artifact.trained_file_path),
+                                    DataValidation.read_data(file_path=self.data_ingestion_artifact.test_file_path))
                 drift_status  = self.detect_dataset_drift(train_df,test_df)
                 if drift_status:
                     logging.info("Drift detected")
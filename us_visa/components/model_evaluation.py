@@ -11,8 +11,9 @@ from us_visa.entity.artifact_entity import (DataIngestionArtifact,
 
 from us_visa.entity.s3_estimator import USvisaEstimator
 from us_visa.entity.estimator import UsVisaModel,TargetValueMapping
+from us_visa.entity.feature_spec import load_feature_spec
 
-from us_visa.constants.constant import TARGET_COLUMN,CURRENT_YEAR
+from us_visa.constants.constant import TARGET_COLUMN
 
 from us_visa.exception.exceptions import USvisaException
 from us_visa.logger.logger import logging
@@ -26,20 +27,58 @@ class EvaluationModelResponse:
     is_model_accepted: bool 
     difference: float
 
+# best_model default of ModelEvaluation, the production model is looked up during evaluation
+NOT_PREFETCHED = object()
+
 class ModelEvaluation:
     def __init__(self,
                  model_eval_config: ModelEvaluationConfig,
                  data_ingestion_artifact: DataIngestionArtifact,
-                 model_trainer_artifact: ModelTrainerArtifact):
-        
+                 model_trainer_artifact: ModelTrainerArtifact,
+                 best_model: Optional[USvisaEstimator] = NOT_PREFETCHED):
+        '''
+        :param best_model: production model from prefetch_best_model, None when production has no model
+        '''
         try:
             self.model_eval_config = model_eval_config
             self.data_ingestion_artifact = data_ingestion_artifact
             self.model_trainer_artifact = model_trainer_artifact
+            self.best_model = best_model
         
         except Exception as e:
             raise USvisaException(str(e),sys)
     
+    @staticmethod
+    def fetch_best_model(model_eval_config: ModelEvaluationConfig) -> Optional[USvisaEstimator]:
+        try:
+            bucket_name = model_eval_config.bucket_name
+            model_path =  model_eval_config.s3_model_key_path
+            usvisa_estimator = USvisaEstimator(bucket_name=bucket_name,
+                                               model_path=model_path,
+                                               release_pointer_key=model_eval_config.release_pointer_key)
+            
+            if usvisa_estimator.is_registered():
+                return usvisa_estimator
+        except Exception as e:
+            raise USvisaException(str(e),sys)
+
+    @staticmethod
+    def prefetch_best_model(model_eval_config: ModelEvaluationConfig) -> Optional[USvisaEstimator]:
+        '''
+        Downloads and deserializes the production model ahead of evaluation, it does not depend on the trained model
+
+        Output: Returns the loaded model object if available in s3 storage
+        On Failure: Raises exception
+        '''
+        try:
+            usvisa_estimator = ModelEvaluation.fetch_best_model(model_eval_config)
+            if usvisa_estimator is not None:
+                usvisa_estimator.loaded_model = usvisa_estimator.load_model()
+                logging.info(f"Prefetched production model version {usvisa_estimator.model_version}")
+            return usvisa_estimator
+        except Exception as e:
+            raise USvisaException(str(e),sys)
+
     def get_best_model(self) -> Optional[USvisaEstimator]:
         '''
         This retrieves the model from production
@@ -47,16 +86,9 @@ class ModelEvaluation:
         Output: Returns the model object if available in s3 storage
         On Failure: Raises exception
         '''
-        try:
-            bucket_name = self.model_eval_config.bucket_name
-            model_path =  self.model_eval_config.s3_model_key_path
-            usvisa_estimator = USvisaEstimator(bucket_name=bucket_name,
-                                               model_path=model_path)
-            
-            if usvisa_estimator.is_model_present(model_path=model_path):
-                return usvisa_estimator
-        except Exception as e:
-            raise USvisaException(str(e),sys)
+        if self.best_model is not NOT_PREFETCHED:
+            return self.best_model
+        return self.fetch_best_model(self.model_eval_config)
     
     def evaluate_model(self) -> EvaluationModelResponse:
         '''
@@ -66,8 +98,7 @@ class ModelEvaluation:
         '''
 
         try:
-            test_df = pd.read_csv(self.data_ingestion_artifact.test_file_path)
-            test_df["company_age"] = CURRENT_YEAR - test_df["yr_of_estab"]
+            test_df = load_feature_spec().transform(pd.read_csv(self.data_ingestion_artifact.test_file_path))
 
             x,y = test_df.drop(TARGET_COLUMN,axis=1),test_df[TARGET_COLUMN]
             mapping = TargetValueMapping()._asdict()
@@ -113,6 +144,7 @@ class ModelEvaluation:
                 is_model_accepted=evaluation_model_response.is_model_accepted,
                 s3_model_path=s3_model_path,
                 trained_model_path=self.model_trainer_artifact.trained_model_file_path,
+                trained_onnx_model_path=self.model_trainer_artifact.onnx_model_file_path,
                 changed_accuracy=evaluation_model_response.difference
             )
 
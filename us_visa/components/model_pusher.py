@@ -1,6 +1,6 @@
 import sys 
 
-from us_visa.cloud_storage.aws_storage import SimpleStorageService
+from us_visa.cloud_storage.storage_backend import get_storage_backend
 from us_visa.exception.exceptions import USvisaException
 from us_visa.logger.logger import logging 
 from us_visa.entity.artifact_entity import ModelPusherArtifact,ModelEvaluationArtifact
@@ -16,23 +16,33 @@ class ModelPusher:
         :param model_pusher_config: Configuration for model pusher
         """
         
-        self.s3 = SimpleStorageService()
+        self.storage = get_storage_backend()
         self.model_evaluation_artifact = model_evaluation_artifact
         self.model_pusher_config = model_pusher_config
         self.usvisa_estimator = USvisaEstimator(bucket_name=model_pusher_config.bucket_name,
-                                                model_path=model_pusher_config.s3_model_key_path)
+                                                model_path=model_pusher_config.s3_model_key_path,
+                                                storage=self.storage,
+                                                release_pointer_key=model_pusher_config.release_pointer_key)
     
     def initiate_model_pusher(self) -> ModelPusherArtifact:
         '''
         Initiates all steps of model pusher
         '''
         try:
-            logging.info("Uploading artifacts into s3 bucket")
+            logging.info("Uploading artifacts into the model registry")
 
-            self.usvisa_estimator.save_model(from_file=self.model_evaluation_artifact.trained_model_path)
+            # the pickle and its onnx graph go out as one release, a model without a graph is served from its pickle
+            release_files = {self.model_pusher_config.s3_model_key_path: self.model_evaluation_artifact.trained_model_path}
+            trained_onnx_model_path = self.model_evaluation_artifact.trained_onnx_model_path
+            if trained_onnx_model_path is not None:
+                release_files[self.model_pusher_config.s3_onnx_model_key_path] = trained_onnx_model_path
+
+            release = self.usvisa_estimator.publish_release(release_files,
+                                                            release_prefix=self.model_pusher_config.release_prefix)
+            
             model_pusher_artifact = ModelPusherArtifact(bucket_name=self.model_pusher_config.bucket_name,
-                                                        s3_model_path=self.model_pusher_config.s3_model_key_path)
-            logging.info("Uploaded artifacts folder to s3 bucket")
+                                                        s3_model_path=f"{release}/{self.model_pusher_config.s3_model_key_path}")
+            logging.info("Uploaded artifacts to the model registry")
             logging.info(f"Model pusher artifact:{model_pusher_artifact}")
 
             return model_pusher_artifact
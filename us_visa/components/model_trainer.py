@@ -1,8 +1,11 @@
+import os
 import sys 
-from typing import Tuple 
+import time
+from typing import Optional, Tuple 
 
 import importlib
 
+import dill
 import numpy as np 
 import pandas as pd 
 from pandas import DataFrame
@@ -13,11 +16,16 @@ from sklearn.metrics import (accuracy_score,
                              precision_score,
                              recall_score)
 
-from sklearn.model_selection import GridSearchCV
+from sklearn.model_selection import GridSearchCV, train_test_split
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.base import clone
+from scipy import sparse
 
 from us_visa.exception.exceptions import USvisaException
 from us_visa.logger.logger import logging 
 from us_visa.utils.main_utils import (load_numpy_array_data,
+                                      load_feature_array_data,
                                       read_yaml_file,
                                       load_object,
                                       save_object)
@@ -26,9 +34,13 @@ from us_visa.entity.config_entity import ModelTrainerConfig
 
 from us_visa.entity.artifact_entity import (DataTransformationArtifact,
                                             ModelTrainerArtifact,
-                                            ClassificationMetricArtifact)
+                                            ClassificationMetricArtifact,
+                                            InferenceCostArtifact)
 
 from us_visa.entity.estimator import UsVisaModel
+from us_visa.entity.tree_ensemble import FlatTreeEnsemble
+from us_visa.entity.onnx_estimator import export_usvisa_model_to_onnx, get_onnx_unsupported_reason, OnnxUsVisaModel
+from us_visa.pipeline.search_backend import SearchBackend
 
 class ModelTrainer:
     def __init__(self,
@@ -36,56 +48,333 @@ class ModelTrainer:
                  model_trainer_config: ModelTrainerConfig):
         self.data_transformation_artifact = data_transformation_artifact
         self.model_trainer_config = model_trainer_config
+        self.best_inference_cost = None
+
+    @staticmethod
+    def requires_dense_input(model: object,model_config: dict) -> bool:
+        '''
+        A model block can set dense_input in model.yaml, otherwise the estimator's sklearn tags decide
+        '''
+        if "dense_input" in model_config:
+            return bool(model_config["dense_input"])
+        
+        if hasattr(model,"__sklearn_tags__"):
+            return not model.__sklearn_tags__().input_tags.sparse
+        
+        return False
+
+    def measure_inference_cost(self,usvisa_model: UsVisaModel,test_feature_df: DataFrame) -> InferenceCostArtifact:
+        '''
+        This method measures what a candidate costs at serving time through the model object that would be served,
+        preprocessing included, on the raw test features: single row latency percentiles, batch throughput,
+        pickled size and unpickling time
+        Output      :   Returns inference cost artifact
+        On Failure  :   Write an exception log and then raise an exception
+        '''
+        try:
+            n_samples = min(self.model_trainer_config.latency_samples,len(test_feature_df))
+            single_row_ms = []
+            for i in range(n_samples):
+                row = test_feature_df.iloc[i:i + 1]
+                start = time.perf_counter()
+                usvisa_model.predict(row)
+                single_row_ms.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            usvisa_model.predict(test_feature_df)
+            batch_ms = (time.perf_counter() - start) * 1000
+
+            payload = dill.dumps(usvisa_model)
+            start = time.perf_counter()
+            dill.loads(payload)
+            load_ms = (time.perf_counter() - start) * 1000
+
+            return InferenceCostArtifact(p50_latency_ms=float(np.percentile(single_row_ms,50)),
+                                         p99_latency_ms=float(np.percentile(single_row_ms,99)),
+                                         batch_ms_per_1k_rows=batch_ms * 1000 / len(test_feature_df),
+                                         model_mb=len(payload) / 2**20,
+                                         load_ms=load_ms)
+        
+        except Exception as e:
+            raise USvisaException(str(e),sys)
+
+    @staticmethod
+    def condense_to_prototypes(x_train: np.array,y_train: np.array,n_prototypes_per_class: int,random_state: int):
+        '''
+        Replaces the rows of every class by k-means centroids of that class, small classes are kept as they are
+        '''
+        prototypes,labels = [],[]
+        for label in np.unique(y_train):
+            x_class = np.asarray(x_train[y_train == label])
+            if len(x_class) <= n_prototypes_per_class:
+                prototypes.append(x_class)
+            else:
+                kmeans = MiniBatchKMeans(n_clusters=n_prototypes_per_class,random_state=random_state,n_init=3)
+                prototypes.append(kmeans.fit(x_class).cluster_centers_.astype(x_class.dtype))
+            labels.append(np.full(len(prototypes[-1]),label,dtype=y_train.dtype))
+        
+        return np.vstack(prototypes),np.concatenate(labels)
+
+    def build_knn_serving_model(self,
+                                model: KNeighborsClassifier,
+                                serving_config: dict,
+                                x_train: np.array,
+                                y_train: np.array,
+                                x_test: np.array,
+                                y_test: np.array) -> KNeighborsClassifier:
+        '''
+        This method refits the searched KNN with a prebuilt tree index and, when configured, on condensed
+        prototypes so serving cost and model size stop growing with the training set
+        Output      :   Returns the KNN model to serve
+        On Failure  :   Write an exception log and then raise an exception
+        '''
+        try:
+            if sparse.issparse(x_train):
+                logging.info("Tree index needs dense features, serving the searched KNN as it is")
+                return model
+            
+            index_params = {"algorithm": serving_config.get("index_algorithm","kd_tree"),
+                            "leaf_size": serving_config.get("leaf_size",40)}
+            indexed_model = clone(model).set_params(**index_params).fit(x_train,y_train)
+            base_accuracy = accuracy_score(y_test,indexed_model.predict(x_test))
+
+            n_prototypes_per_class = serving_config.get("n_prototypes_per_class")
+            if n_prototypes_per_class is None:
+                return indexed_model
+            
+            x_proto,y_proto = self.condense_to_prototypes(x_train,y_train,
+                                                          n_prototypes_per_class=n_prototypes_per_class,
+                                                          random_state=serving_config.get("random_state"))
+            condensed_model = clone(model).set_params(**index_params).fit(x_proto,y_proto)
+            condensed_accuracy = accuracy_score(y_test,condensed_model.predict(x_test))
+            accuracy_drop = base_accuracy - condensed_accuracy
+
+            logging.info(f"KNN condensed from {len(y_train)} rows to {len(y_proto)} prototypes, "
+                         f"accuracy {base_accuracy:.4f} -> {condensed_accuracy:.4f} (drop {accuracy_drop:.4f})")
+            
+            if accuracy_drop > serving_config.get("max_accuracy_drop",0.0):
+                logging.info("Accuracy drop over max_accuracy_drop, serving the indexed model on all training rows")
+                return indexed_model
+            
+            return condensed_model
+        
+        except Exception as e:
+            raise USvisaException(str(e),sys)
+
+    def build_inference_engine(self,model: object,x_test: np.array) -> Optional[FlatTreeEnsemble]:
+        '''
+        This method converts a fitted forest into the flat tree inference engine and checks that its
+        probabilities on the test split are bit identical to the forest's own
+        Output      :   Returns the engine, None when disabled, unsupported or not identical
+        On Failure  :   Write an exception log and then raise an exception
+        '''
+        try:
+            if not self.model_trainer_config.tree_inference_engine or not FlatTreeEnsemble.is_supported(model):
+                return None
+            
+            inference_engine = FlatTreeEnsemble.from_sklearn(model)
+
+            # threaded prediction may add the trees up in any order, the reference run goes tree by tree
+            n_jobs = model.n_jobs
+            model.set_params(n_jobs=1)
+            try:
+                identical = np.array_equal(inference_engine.predict_proba(x_test),model.predict_proba(x_test))
+            finally:
+                model.set_params(n_jobs=n_jobs)
+            
+            if not identical:
+                logging.info("Flat tree inference engine output differs from the forest, serving the forest only")
+                return None
+            
+            logging.info(f"Built flat tree inference engine over {len(inference_engine.roots)} trees "
+                         f"and {len(inference_engine.feature)} nodes")
+            return inference_engine
+        
+        except Exception as e:
+            raise USvisaException(str(e),sys)
+
+    def build_usvisa_model(self,
+                           model: object,
+                           x_test: np.array,
+                           dense_input: bool,
+                           preprocessing_obj: object,
+                           reference_profile: object) -> UsVisaModel:
+        '''
+        Wraps a fitted candidate into the model object that is saved and served
+        '''
+        return UsVisaModel(preprocessing_object=preprocessing_obj,
+                           trained_model_object=model,
+                           reference_profile=reference_profile,
+                           dense_input=dense_input,
+                           inference_engine=self.build_inference_engine(model,x_test),
+                           inference_engine_max_rows=self.model_trainer_config.tree_inference_engine_max_rows,
+                           feature_dtype=x_test.dtype.str)
+
+    def export_onnx_model(self,usvisa_model: UsVisaModel) -> Optional[str]:
+        '''
+        This method exports the preprocessor and classifier as one ONNX graph and checks that its labels
+        agree with the sklearn model on the raw test features
+        Output      :   Returns the ONNX model file path, None when disabled or the model family is not exported
+        On Failure  :   Raises when a model family that is exported fails to convert or to agree
+        '''
+        try:
+            if not self.model_trainer_config.onnx_export:
+                return None
+            
+            test_feature_df = pd.read_csv(self.data_transformation_artifact.test_feature_file_path)
+
+            unsupported_reason = get_onnx_unsupported_reason(usvisa_model,test_feature_df.iloc[:1])
+            if unsupported_reason is not None:
+                logging.warning(f"ONNX export is on but {usvisa_model} is not exported: {unsupported_reason}")
+                return None
+
+            onnx_model = export_usvisa_model_to_onnx(usvisa_model,sample_df=test_feature_df.iloc[:1])
+            onnx_predictions = OnnxUsVisaModel(onnx_model).predict(test_feature_df)
+
+            agreement = float(np.mean(onnx_predictions == usvisa_model.predict(test_feature_df)))
+            logging.info(f"ONNX model agrees with the sklearn model on {agreement:.6f} of the test split")
+
+            if agreement < self.model_trainer_config.onnx_min_agreement:
+                raise Exception(f"ONNX graph of {usvisa_model} agrees with it on {agreement:.6f} of the test split, "
+                                f"under {self.model_trainer_config.onnx_min_agreement}")
+            
+            os.makedirs(os.path.dirname(self.model_trainer_config.onnx_model_file_path),exist_ok=True)
+            with open(self.model_trainer_config.onnx_model_file_path,"wb") as f:
+                f.write(onnx_model)
+            
+            return self.model_trainer_config.onnx_model_file_path
+        
+        except Exception as e:
+            raise USvisaException(str(e),sys)
+
+    @staticmethod
+    def get_fit_params(model_config: dict,x_train: np.array,y_train: np.array) -> Tuple[np.array,np.array,dict]:
+        '''
+        Returns the rows the search fits on and the fit params of the model family.
+        With eval_set_fraction a stratified slice of the training rows is held out and passed as eval_set,
+        boosting families stop adding trees once that set stops improving
+        '''
+        fit_params = dict(model_config.get("fit_params") or {})
+        eval_set_fraction = model_config.get("eval_set_fraction")
+        if not eval_set_fraction:
+            return x_train,y_train,fit_params
+        
+        x_fit,x_eval,y_fit,y_eval = train_test_split(x_train,y_train,
+                                                     test_size=eval_set_fraction,
+                                                     stratify=y_train,
+                                                     random_state=model_config.get("params",{}).get("random_state"))
+        fit_params["eval_set"] = [(x_eval,y_eval)]
+        return x_fit,y_fit,fit_params
+
+    @staticmethod
+    def get_budget_violations(inference_cost: InferenceCostArtifact,selection_config: dict) -> list:
+        '''
+        Returns the serving budgets from the selection_objective section that the candidate exceeds
+        '''
+        budgets = {"max_p99_latency_ms": inference_cost.p99_latency_ms,
+                   "max_batch_ms_per_1k_rows": inference_cost.batch_ms_per_1k_rows,
+                   "max_model_mb": inference_cost.model_mb,
+                   "max_load_ms": inference_cost.load_ms}
+        
+        return [f"{budget}={selection_config[budget]} (measured {value:.3f})" 
+                for budget,value in budgets.items() 
+                if selection_config.get(budget) is not None and value > selection_config[budget]]
+
+    @staticmethod
+    def get_selection_objective(accuracy: float,inference_cost: InferenceCostArtifact,selection_config: dict) -> float:
+        weights = selection_config.get("weights",{})
+        return (weights.get("accuracy",1.0) * accuracy 
+                - weights.get("p99_latency_ms",0.0) * inference_cost.p99_latency_ms 
+                - weights.get("model_mb",0.0) * inference_cost.model_mb)
 
     def get_model_object_and_report(self,
-                                    train: np.array,
-                                    test: np.array) -> Tuple[object,object]:
+                                    x_train: np.array,
+                                    y_train: np.array,
+                                    x_test: np.array,
+                                    y_test: np.array) -> Tuple[object,object]:
         '''
-        This method performs GridSearchCV to find the best model
-        Output      :   Returns metric artifact object and best model object
+        This method performs GridSearchCV to find the best model, each candidate is costed as the usvisa model it would be served as
+        Output      :   Returns the best usvisa model, its metric artifact and accuracy
         On Failure  :   Write an exception log and then raise an exception
         '''
         try:
             logging.info("Performing GridSearchCV")
 
-            # loading the npy array
-            x_train,y_train = train[:,:-1],train[:,-1]
-            x_test,y_test = test[:,:-1],test[:,-1]
-
             config  = read_yaml_file(self.model_trainer_config.model_config_file_path)
 
             grid_params = config["grid_search"]["params"]
             model_blocks = config["model_selection"]
+            use_class_weight = config.get("resampling",{}).get("strategy") == "class_weight"
+            selection_config = config.get("selection_objective",{})
+
+            preprocessing_obj = load_object(file_path=self.data_transformation_artifact.transformed_object_file_path)
+            reference_profile = load_object(file_path=self.data_transformation_artifact.reference_profile_file_path)
+            test_feature_df = pd.read_csv(self.data_transformation_artifact.test_feature_file_path)
 
             best_model = None 
             best_metric_artifact = None 
+            best_score = 0.0
+            best_objective = None
 
-            for _,model_config in model_blocks.items():
-                # loading the GridSearch model class 
-                module = importlib.import_module(model_config["module"])
-                model_class = getattr(module,model_config["class"])
+            # candidate fits run on the configured backend, results come back to this process for selection
+            with SearchBackend(config.get("search_backend")) as search_backend:
+                for _,model_config in model_blocks.items():
+                    # loading the GridSearch model class 
+                    module = importlib.import_module(model_config["module"])
+                    model_class = getattr(module,model_config["class"])
 
-                # load the model with fixed params
-                model = model_class(**model_config.get("params",{}))
+                    # load the model with fixed params
+                    model = model_class(**model_config.get("params",{}))
 
-                gs = GridSearchCV(estimator=model,
-                                           param_grid=model_config["search_param_grid"],
-                                           **grid_params)
+                    # with the class_weight strategy the imbalance is handled by the estimator instead of resampling
+                    if use_class_weight and "class_weight" in model.get_params():
+                        model.set_params(class_weight="balanced")
+
+                    # sparse features are only densified for estimators that cannot take csr input
+                    dense_input = sparse.issparse(x_train) and self.requires_dense_input(model,model_config)
+                    model_x_train = x_train.toarray() if dense_input else x_train
+                    model_x_test = x_test.toarray() if dense_input else x_test
+
+                    # per family fit params (eval sets, verbosity) are forwarded to every fit of the search
+                    search_x_train,search_y_train,fit_params = self.get_fit_params(model_config,model_x_train,y_train)
+
+                    gs = GridSearchCV(estimator=model,
+                                               param_grid=model_config["search_param_grid"],
+                                               **grid_params)
                 
-                logging.info(f"Running GridSearchCV for {model_class.__name__}")
-                gs.fit(x_train,y_train)
-
-                y_pred = gs.best_estimator_.predict(x_test)
-                acc = accuracy_score(y_test,y_pred)
-
-                if acc > self.model_trainer_config.expected_accuracy:
-                    best_score = acc 
-                    best_model = gs.best_estimator_
-                    best_metric_artifact = ClassificationMetricArtifact(
-                        f1_score=f1_score(y_test,y_pred),
-                        precision_score=precision_score(y_test,y_pred),
-                        recall_score=recall_score(y_test,y_pred)
-                    )
+                    logging.info(f"Running GridSearchCV for {model_class.__name__}, dense input:{dense_input}, "
+                                 f"fit params:{sorted(fit_params)}")
+                    with search_backend.parallel(scatter=[search_x_train,search_y_train]):
+                        gs.fit(search_x_train,search_y_train,**fit_params)
+
+                    candidate_model = gs.best_estimator_
+                    if isinstance(candidate_model,KNeighborsClassifier) and "serving" in model_config:
+                        candidate_model = self.build_knn_serving_model(candidate_model,model_config["serving"],
+                                                                       model_x_train,y_train,model_x_test,y_test)
+
+                    y_pred = candidate_model.predict(model_x_test)
+                    acc = accuracy_score(y_test,y_pred)
+
+                    usvisa_model = self.build_usvisa_model(candidate_model,x_test,dense_input,preprocessing_obj,reference_profile)
+                    inference_cost = self.measure_inference_cost(usvisa_model,test_feature_df)
+                    violations = self.get_budget_violations(inference_cost,selection_config)
+                    objective = self.get_selection_objective(acc,inference_cost,selection_config)
+                    logging.info(f"{model_class.__name__}: accuracy={acc:.4f}, objective={objective:.4f}, {inference_cost}")
+
+                    if violations:
+                        logging.info(f"Rejected {model_class.__name__}, over serving budget: {violations}")
+                        continue
+
+                    if acc > self.model_trainer_config.expected_accuracy and (best_objective is None or objective > best_objective):
+                        best_score = acc 
+                        best_objective = objective
+                        best_model = usvisa_model
+                        self.best_inference_cost = inference_cost
+                        best_metric_artifact = ClassificationMetricArtifact(
+                            f1_score=f1_score(y_test,y_pred),
+                            precision_score=precision_score(y_test,y_pred),
+                            recall_score=recall_score(y_test,y_pred)
+                        )
             
             return best_model,best_metric_artifact,best_score
         
@@ -99,28 +388,31 @@ class ModelTrainer:
         '''
 
         try:
-            train_arr = load_numpy_array_data(file_path=self.data_transformation_artifact.transformed_train_file_path)
-            test_arr = load_numpy_array_data(file_path=self.data_transformation_artifact.transformed_test_file_path)
+            # memory mapped read only arrays, the grid search workers share the pages instead of copying them
+            x_train = load_feature_array_data(file_path=self.data_transformation_artifact.transformed_train_file_path,mmap_mode="r")
+            y_train = load_numpy_array_data(file_path=self.data_transformation_artifact.transformed_train_label_file_path,mmap_mode="r")
+            x_test = load_feature_array_data(file_path=self.data_transformation_artifact.transformed_test_file_path,mmap_mode="r")
+            y_test = load_numpy_array_data(file_path=self.data_transformation_artifact.transformed_test_label_file_path,mmap_mode="r")
 
-            best_model,best_metric_artifact,best_score = self.get_model_object_and_report(train=train_arr,
-                                                                                          test=test_arr)
+            usvisa_model,best_metric_artifact,best_score = self.get_model_object_and_report(x_train=x_train,
+                                                                                            y_train=y_train,
+                                                                                            x_test=x_test,
+                                                                                            y_test=y_test)
             
-            preprocessing_obj = load_object(file_path=self.data_transformation_artifact.transformed_object_file_path)
-
             if best_score < self.model_trainer_config.expected_accuracy:
                 logging.info("No best model found with higher accuracy score than baseline")
                 raise Exception("No best model found with higher accuracy score than baseline")
             
-            usvisa_model = UsVisaModel(preprocessing_object=preprocessing_obj,
-                                       trained_model_object=best_model)
-            logging.info("Created usvisa model object with preprocessor and model")
             logging.info("Created best model file path")
             
             save_object(self.model_trainer_config.trained_model_file_path,usvisa_model)
+            onnx_model_file_path = self.export_onnx_model(usvisa_model)
 
             model_trainer_artifact = ModelTrainerArtifact(
                 trained_model_file_path=self.model_trainer_config.trained_model_file_path,
-                metric_artifact=best_metric_artifact
+                metric_artifact=best_metric_artifact,
+                inference_cost_artifact=self.best_inference_cost,
+                onnx_model_file_path=onnx_model_file_path
             )
 
             logging.info(f"Model trainer artifact:{model_trainer_artifact}")
@@ -16,6 +16,7 @@ TEST_FILE_NAME: str = "test.csv"
 
 FILE_NAME: str = "usvisa.csv"
 MODEL_FILE_NAME = "model.pkl"
+ONNX_MODEL_FILE_NAME = "model.onnx"
 
 TARGET_COLUMN: str = "case_status"
 CURRENT_YEAR = date.today().year
@@ -28,23 +29,43 @@ AWS_ACCESS_KEY_ID_ENV_KEY = "AWS_ACCESS_KEY_ID"
 AWS_SECRET_ACCESS_ID_ENV_KEY = "AWS_SECRET_ACCESS_KEY_ID"
 REGION_NAME = "ap-southeast-1"
 
+# Stage cache constants, entries are shared across timestamped runs
+STAGE_CACHE_DIR_NAME: str = "stage_cache"
+STAGE_CACHE_ENABLED: bool = True
+
+# Training pipeline runner constants, independent stages and background writes overlap
+TRAINING_PIPELINE_MAX_WORKERS: int = 4
+TRAINING_PIPELINE_BACKGROUND_WORKERS: int = 2
+
 # Below are the data ingestion related constants 
 DATA_INGESTION_COLLECTION_NAME: str = "visa_data"
 DATA_INGESTION_DIR_NAME: str = "data_ingestion"
 DATA_INGESTION_FEATURE_STORE: str = "feature_store"
 DATA_INGESTION_INGESTED_DIR: str = "ingested"
 DATA_INGESTION_TRAIN_TEST_SPLIT_RATIO: float = 0.2
+DATA_INGESTION_EXPORT_PARTITIONS: int = 4
+DATA_INGESTION_SPLIT_MODE: str = "hash" # hash | random
+DATA_INGESTION_SPLIT_KEY: str = "case_id"
+DATA_INGESTION_STREAM_BATCH_SIZE: int = 10000
 
 
 # Data validation related constants 
 DATA_VALIDATION_DIR_NAME: str = "data_validation"
 DATA_VALIDATION_DRIFT_REPORT_DIR: str = "drift_report"
-DATA_VALIDATION_DRIFT_REPORT_FILE_NAME: str = "report.yaml" 
+DATA_VALIDATION_DRIFT_REPORT_FILE_NAME: str = "report.json" 
+DATA_VALIDATION_DRIFT_REPORT_DETAILS_FILE_NAME: str = "report_details.json.gz"
+DATA_VALIDATION_WRITE_FULL_DRIFT_REPORT: bool = False
 
 # Data transformation constants 
 DATA_TRANSFORMATION_DIR_NAME: str = "data_transformation"
 DATA_TRANSFORMATION_TRANSFORMED_DATA_DIR: str = "transforms"
 DATA_TRANSFORMATION_TRANSFORMED_OBJECT_DIR: str = "transformed_object"
+DATA_TRANSFORMATION_REFERENCE_PROFILE_FILE_NAME: str = "reference_profile.pkl"
+DATA_TRANSFORMATION_TEST_FEATURE_FILE_NAME: str = "test_features.csv"
+DATA_TRANSFORMATION_LABEL_FILE_SUFFIX: str = "_labels"
+DATA_TRANSFORMATION_FEATURE_DTYPE: str = "float32"
+DATA_TRANSFORMATION_LABEL_DTYPE: str = "int8"
+DATA_TRANSFORMATION_SPARSE_OUTPUT: bool = False
 
 # Model training constants
 MODEL_TRAINER_DIR_NAME: str = "model_trainer"
@@ -52,13 +73,55 @@ MODEL_TRAINER_TRAINED_MODEL_DIR: str = "trained_model"
 MODEL_TRAINER_TRAINED_MODEL_NAME: str ="model.pkl"
 MODEL_TRAINER_EXPECTED_SCORE: float = 0.6 # Set higher benchmark for this score atleast 80% acc
 MODEL_TRAINER_MODEL_CONFIG_FILE_PATH: str = os.path.join("config","model.yaml")
+MODEL_TRAINER_LATENCY_SAMPLES: int = 200
+MODEL_TRAINER_TREE_INFERENCE_ENGINE: bool = True
+MODEL_TRAINER_TREE_INFERENCE_ENGINE_MAX_ROWS: int = 256
+MODEL_TRAINER_ONNX_EXPORT: bool = True
+MODEL_TRAINER_ONNX_MIN_AGREEMENT: float = 0.995 # the graph preprocesses in float32, rows on a split boundary can flip
 
 # Model evaluation constants
 MODEL_EVALUATION_CHANGED_THRESHOLD_SCORE: float = 0.02
 MODEL_BUCKET_NAME = "usvisa-model-1-2026"
 MODEL_PUSHER_S3_KEY = "model-registry"
+# every push is a release under MODEL_PUSHER_S3_KEY, this key names the current one and is published last
+MODEL_RELEASE_POINTER_KEY = "model-registry/current"
+
+# Model registry storage constants, s3 | local; the environment variable overrides the default
+STORAGE_BACKEND: str = "s3"
+STORAGE_BACKEND_ENV_KEY: str = "USVISA_STORAGE_BACKEND"
+LOCAL_STORAGE_ROOT_DIR: str = "model_registry"
+LOCAL_STORAGE_ROOT_DIR_ENV_KEY: str = "USVISA_LOCAL_STORAGE_DIR"
 
 # Prediction pipeline constants 
 APP_HOST = "0.0.0.0"
 APP_PORT = 8080
+PREDICTION_CACHE_ENABLED: bool = True
+PREDICTION_CACHE_MAX_SIZE: int = 10000
+PREDICTION_CACHE_TTL_SECONDS: float = 3600
+PREDICTION_CACHE_MAX_BATCH_ROWS: int = 256
+PREDICTION_BATCH_ENABLED: bool = True
+PREDICTION_BATCH_MAX_SIZE: int = 64
+PREDICTION_BATCH_WINDOW_MS: float = 5
+PREDICTION_WARMUP_ROUNDS: int = 3
+PREDICTION_WARMUP_ROWS: int = 32
+PREDICTION_WARMUP_RETRY_INITIAL_SECONDS: float = 1.0
+PREDICTION_WARMUP_RETRY_MAX_SECONDS: float = 60.0
+PREDICTION_MODEL_RUNTIME: str = "sklearn" # sklearn | onnx
+
+# Prediction audit log constants
+PREDICTION_LOG_ENABLED: bool = False
+PREDICTION_LOG_ENABLED_ENV_KEY: str = "USVISA_PREDICTION_LOG_ENABLED"
+PREDICTION_LOG_COLLECTION_NAME: str = "prediction_log"
+PREDICTION_LOG_MAX_BUFFER_SIZE: int = 50000
+PREDICTION_LOG_FLUSH_SIZE: int = 500
+PREDICTION_LOG_FLUSH_INTERVAL_SECONDS: float = 1.0
+PREDICTION_LOG_CLOSE_TIMEOUT_SECONDS: float = 10.0
+
+# Online drift monitor constants
+DRIFT_MONITOR_WINDOW_SIZE: int = 1000
+DRIFT_MONITOR_CHECK_INTERVAL: int = 100
+DRIFT_MONITOR_MIN_SAMPLES: int = 200
+DRIFT_MONITOR_NUM_BINS: int = 10
+DRIFT_MONITOR_PSI_THRESHOLD: float = 0.2
+DRIFT_MONITOR_EPSILON: float = 1e-4
 
@@ -1,36 +1,189 @@
 from us_visa.configuration.mongo_db_connection import MongoDBClient
-from us_visa.constants.constant import DATABASE_NAME
+from us_visa.constants.constant import DATABASE_NAME,SCHEMA_FILE_PATH
+from us_visa.entity.feature_spec import FeatureSpec
 from us_visa.exception.exceptions import USvisaException
+from us_visa.logger.logger import logging
+from us_visa.utils.main_utils import read_yaml_file
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
 
-import pandas as pd 
-import numpy as np 
-from typing import Optional 
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from pymongo.collection import Collection
 
 class UsVisaData:
     def __init__(self):
         try:
             self.mongo_client = MongoDBClient(database_name=DATABASE_NAME)
+            self._schema_config = read_yaml_file(file_path=SCHEMA_FILE_PATH)
+            self.export_pipeline = self.build_export_pipeline(self._schema_config)
 
         except Exception as e:
             raise USvisaException(e,sys)
-    
+
+    @staticmethod
+    def build_export_pipeline(schema_config: dict,extra_columns: Tuple[str,...] = ()) -> List[dict]:
+        '''
+        Builds the aggregation stages that turn a raw document into a row of the exported dataset,
+        the projection comes from the feature spec and covers the schema columns plus extra_columns
+        '''
+        columns = UsVisaData.get_export_columns(schema_config,extra_columns)
+        return [{"$project": FeatureSpec.from_schema(schema_config).get_mongo_projection(columns)}]
+
+    @staticmethod
+    def get_export_columns(schema_config: dict,extra_columns: Tuple[str,...] = ()) -> List[str]:
+        return [next(iter(column)) for column in schema_config["columns"]] + list(extra_columns)
+
+    @staticmethod
+    def get_partition_bounds(collection: Collection,
+                             n_partitions: int,
+                             samples_per_partition: int = 20) -> List[Tuple[object,object]]:
+        '''
+        Splits the collection into _id ranges of about equal size.
+        Split points are quantiles of a server side $sample of _ids; ObjectId time bounds are not used
+        because a bulk loaded collection shares one insertion second. None leaves a range open
+        '''
+        sampled_ids = sorted(document["_id"] for document in collection.aggregate([
+            {"$sample": {"size": n_partitions * samples_per_partition}},
+            {"$project": {"_id": 1}}
+        ]))
+
+        split_points = []
+        for i in range(1,n_partitions):
+            if not sampled_ids:
+                break
+            split_point = sampled_ids[i * len(sampled_ids) // n_partitions]
+            if not split_points or split_point > split_points[-1]:
+                split_points.append(split_point)
+
+        return list(zip([None] + split_points,split_points + [None]))
+
+    def get_partition_stages(self,bounds: Tuple[object,object],extra_columns: Tuple[str,...] = ()) -> List[dict]:
+        '''
+        Returns the aggregation stages that export one _id range
+        '''
+        lower,upper = bounds
+        id_filter = {}
+        if lower is not None:
+            id_filter["$gte"] = lower
+        if upper is not None:
+            id_filter["$lt"] = upper
+
+        export_pipeline = (self.build_export_pipeline(self._schema_config,extra_columns=extra_columns)
+                           if extra_columns else self.export_pipeline)
+        # sorted on _id so a range always streams in the same order
+        return ([{"$match": {"_id": id_filter}}] if id_filter else []) + [{"$sort": {"_id": 1}}] + export_pipeline
+
+    def read_partition(self,collection: Collection,bounds: Tuple[object,object]) -> Dict[str,list]:
+        '''
+        Reads one _id range through the export pipeline into one list of values per export column,
+        a field a document lacks is None
+        '''
+        columns = self.get_export_columns(self._schema_config)
+        values = {column: [] for column in columns}
+        for document in collection.aggregate(self.get_partition_stages(bounds)):
+            for column in columns:
+                values[column].append(document.get(column))
+        return values
+
+    def build_dataframe(self,partitions: List[Dict[str,list]]) -> pd.DataFrame:
+        '''
+        Builds the exported dataframe from the partitions in _id order, allocating every column once in its schema dtype:
+        int columns as int64 (float64 when they hold nulls), float columns as float64, the others as object.
+        Each column's partition lists are released as soon as the column is built
+        '''
+        schema_dtypes = {name: dtype for column in self._schema_config["columns"] for name,dtype in column.items()}
+        n_rows = sum(len(next(iter(partition.values()),[])) for partition in partitions)
+
+        data = {}
+        for column in self.get_export_columns(self._schema_config):
+            column_parts = [partition.pop(column) for partition in partitions]
+            schema_dtype = schema_dtypes.get(column)
+
+            if schema_dtype in ("int","float"):
+                has_nulls = any(value is None for part in column_parts for value in part)
+                dtype = np.int64 if schema_dtype == "int" and not has_nulls else np.float64
+                values = (np.nan if value is None else value for value in chain.from_iterable(column_parts))
+            else:
+                dtype = object
+                values = chain.from_iterable(column_parts)
+
+            data[column] = np.fromiter(values,dtype=dtype,count=n_rows)
+            del column_parts
+
+        # the arrays become the frame's columns as they are
+        return pd.DataFrame(data,copy=False)
+
+    def read_partition_in_batches(self,
+                                  collection: Collection,
+                                  bounds: Tuple[object,object],
+                                  batch_size: int,
+                                  extra_columns: Tuple[str,...] = ()) -> Iterator[pd.DataFrame]:
+        '''
+        Streams one _id range from its own aggregation cursor as dataframes of at most batch_size rows.
+        $project leaves out the fields a document lacks, every batch is built on the full export column list
+        so batches always carry the same columns in the same order
+        '''
+        columns = self.get_export_columns(self._schema_config,extra_columns)
+        cursor = collection.aggregate(self.get_partition_stages(bounds,extra_columns=extra_columns),batchSize=batch_size)
+
+        batch = []
+        for document in cursor:
+            batch.append(document)
+            if len(batch) == batch_size:
+                yield pd.DataFrame(batch,columns=columns).infer_objects()
+                batch = []
+
+        if batch:
+            yield pd.DataFrame(batch,columns=columns).infer_objects()
+
+    def get_collection(self,collection_name: str,database_name: Optional[str] = None) -> Collection:
+        if database_name is None:
+            return self.mongo_client.database[collection_name]
+        return self.mongo_client.client[database_name][collection_name]
+
+    def export_collection_in_batches(self,
+                                     collection_name: str,
+                                     batch_size: int,
+                                     database_name: Optional[str] = None,
+                                     extra_columns: Tuple[str,...] = ()) -> Iterator[pd.DataFrame]:
+        '''
+        Streams the exported dataset from one aggregation cursor as dataframes of at most batch_size rows.
+        extra_columns (e.g. a split key) are projected next to the schema columns
+        '''
+        try:
+            yield from self.read_partition_in_batches(self.get_collection(collection_name,database_name),
+                                                      (None,None),
+                                                      batch_size=batch_size,
+                                                      extra_columns=extra_columns)
+
+        except Exception as e:
+            raise USvisaException(str(e),sys)
+
     def export_collection_as_dataframe(self,
                                        collection_name: str,
-                                       database_name:Optional[str]=None) -> pd.DataFrame:
+                                       database_name:Optional[str]=None,
+                                       n_partitions: int = 1) -> pd.DataFrame:
+        '''
+        Exports the collection as a dataframe; with n_partitions > 1 the collection is read as _id ranges
+        on concurrent cursors of the pooled client and the partitions are built into one frame in _id order
+        '''
         try:
-            if database_name is None:
-                collection = self.mongo_client.database[collection_name]
-            else:
-                collection = self.mongo_client[database_name][collection_name]
+            collection = self.get_collection(collection_name,database_name)
+
+            if n_partitions <= 1:
+                return self.build_dataframe([self.read_partition(collection,(None,None))])
+
+            bounds = self.get_partition_bounds(collection,n_partitions)
+            logging.info(f"Reading {collection_name} as {len(bounds)} _id range partitions")
 
-            df = pd.DataFrame(list(collection.find()))
+            with ThreadPoolExecutor(max_workers=len(bounds)) as executor:
+                partitions = list(executor.map(lambda partition_bounds: self.read_partition(collection,partition_bounds),bounds))
 
-            if  "_id" in df.columns.tolist():
-                df = df.drop(columns=["_id"],axis=1)
-            
-            df.replace("na",np.nan,inplace=True)
-            return df
+            return self.build_dataframe(partitions)
 
         except Exception as e:
-            raise USvisaException(str(e),sys)
\ No newline at end of file
+            raise USvisaException(str(e),sys)
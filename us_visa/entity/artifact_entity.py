@@ -1,4 +1,5 @@
 from dataclasses import dataclass 
+from typing import Optional
 
 @dataclass 
 class DataIngestionArtifact:
@@ -16,6 +17,10 @@ class DataTransformationArtifact:
     transformed_object_file_path: str
     transformed_train_file_path: str
     transformed_test_file_path: str
+    transformed_train_label_file_path: str
+    transformed_test_label_file_path: str
+    reference_profile_file_path: str
+    test_feature_file_path: str
 
 @dataclass
 class ClassificationMetricArtifact:
@@ -23,10 +28,20 @@ class ClassificationMetricArtifact:
     precision_score: float 
     recall_score: float
 
+@dataclass
+class InferenceCostArtifact:
+    p50_latency_ms: float
+    p99_latency_ms: float
+    batch_ms_per_1k_rows: float
+    model_mb: float
+    load_ms: float
+
 @dataclass 
 class ModelTrainerArtifact:
     trained_model_file_path: str 
     metric_artifact:ClassificationMetricArtifact
+    inference_cost_artifact: InferenceCostArtifact
+    onnx_model_file_path: Optional[str] = None
 
 @dataclass
 class ModelEvaluationArtifact:
@@ -34,6 +49,7 @@ class ModelEvaluationArtifact:
     changed_accuracy: float
     s3_model_path: str 
     trained_model_path: str
+    trained_onnx_model_path: Optional[str] = None
 
 @dataclass 
 class ModelPusherArtifact: 
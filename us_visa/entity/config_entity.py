@@ -1,6 +1,6 @@
 import os 
 from us_visa.constants.constant import * 
-from dataclasses import dataclass 
+from dataclasses import dataclass, field
 from datetime import datetime 
 
 TIMESTAMP: str = datetime.now().strftime("%m_%d_%Y_%H_%M_%S") 
@@ -10,10 +10,18 @@ class TrainingPipelineConfig:
     pipeline_name: str = PIPELINE_NAME
     artifact_dir: str = os.path.join(ARTIFACT_DIR,TIMESTAMP)
     timestamp: str = TIMESTAMP
+    max_workers: int = TRAINING_PIPELINE_MAX_WORKERS
+    background_workers: int = TRAINING_PIPELINE_BACKGROUND_WORKERS
 
 training_pipeline_config: TrainingPipelineConfig = TrainingPipelineConfig()
 
 
+@dataclass
+class StageCacheConfig:
+    stage_cache_dir: str = os.path.join(ARTIFACT_DIR,STAGE_CACHE_DIR_NAME)
+    enabled: bool = STAGE_CACHE_ENABLED
+
+
 @dataclass
 class DataIngestionConfig:
     data_ingestion_dir: str = os.path.join(training_pipeline_config.artifact_dir,DATA_INGESTION_DIR_NAME)
@@ -22,6 +30,12 @@ class DataIngestionConfig:
     testing_file_path: str = os.path.join(data_ingestion_dir,DATA_INGESTION_INGESTED_DIR,TEST_FILE_NAME)
     train_test_split_ratio: float = DATA_INGESTION_TRAIN_TEST_SPLIT_RATIO
     collection_name: str = DATA_INGESTION_COLLECTION_NAME
+    # _id range partitions read concurrently from mongodb, 1 reads the collection on a single cursor
+    export_partitions: int = DATA_INGESTION_EXPORT_PARTITIONS
+    # hash routes each row by its split_key while streaming, random splits the materialized export
+    split_mode: str = DATA_INGESTION_SPLIT_MODE
+    split_key: str = DATA_INGESTION_SPLIT_KEY
+    stream_batch_size: int = DATA_INGESTION_STREAM_BATCH_SIZE
 
 @dataclass 
 class DataValidationConfig:
@@ -29,6 +43,10 @@ class DataValidationConfig:
     drift_report_file_path: str = os.path.join(data_validation_dir,
                                                DATA_VALIDATION_DRIFT_REPORT_DIR,
                                                DATA_VALIDATION_DRIFT_REPORT_FILE_NAME)
+    drift_report_details_file_path: str = os.path.join(data_validation_dir,
+                                                       DATA_VALIDATION_DRIFT_REPORT_DIR,
+                                                       DATA_VALIDATION_DRIFT_REPORT_DETAILS_FILE_NAME)
+    write_full_drift_report: bool = DATA_VALIDATION_WRITE_FULL_DRIFT_REPORT
     
 
 @dataclass 
@@ -42,10 +60,34 @@ class DataTransformationConfig:
                                                     DATA_TRANSFORMATION_TRANSFORMED_DATA_DIR,
                                                     TEST_FILE_NAME.replace("csv","npy"))
     
+    transformed_train_label_file_path: str = os.path.join(data_transformation_dir,
+                                                          DATA_TRANSFORMATION_TRANSFORMED_DATA_DIR,
+                                                          TRAIN_FILE_NAME.replace(".csv",DATA_TRANSFORMATION_LABEL_FILE_SUFFIX + ".npy"))
+    
+    transformed_test_label_file_path: str = os.path.join(data_transformation_dir,
+                                                         DATA_TRANSFORMATION_TRANSFORMED_DATA_DIR,
+                                                         TEST_FILE_NAME.replace(".csv",DATA_TRANSFORMATION_LABEL_FILE_SUFFIX + ".npy"))
+    
+    feature_dtype: str = DATA_TRANSFORMATION_FEATURE_DTYPE
+    label_dtype: str = DATA_TRANSFORMATION_LABEL_DTYPE
+    sparse_output: bool = DATA_TRANSFORMATION_SPARSE_OUTPUT
+    
     transformed_object_file_path: str = os.path.join(data_transformation_dir,
                                                      DATA_TRANSFORMATION_TRANSFORMED_OBJECT_DIR,
                                                      PREPROCESSING_OBJECT_FILE_NAME)
     
+    reference_profile_file_path: str = os.path.join(data_transformation_dir,
+                                                    DATA_TRANSFORMATION_TRANSFORMED_OBJECT_DIR,
+                                                    DATA_TRANSFORMATION_REFERENCE_PROFILE_FILE_NAME)
+    
+    # serving features of the test split before preprocessing, the raw input the exported onnx graph is checked on
+    test_feature_file_path: str = os.path.join(data_transformation_dir,
+                                               DATA_TRANSFORMATION_TRANSFORMED_DATA_DIR,
+                                               DATA_TRANSFORMATION_TEST_FEATURE_FILE_NAME)
+    
+    reference_profile_num_bins: int = DRIFT_MONITOR_NUM_BINS
+    model_config_file_path: str = MODEL_TRAINER_MODEL_CONFIG_FILE_PATH
+
 
 @dataclass 
 class ModelTrainerConfig:
@@ -58,19 +100,76 @@ class ModelTrainerConfig:
     
     expected_accuracy: float = MODEL_TRAINER_EXPECTED_SCORE
     model_config_file_path: str = MODEL_TRAINER_MODEL_CONFIG_FILE_PATH
+    latency_samples: int = MODEL_TRAINER_LATENCY_SAMPLES
+    tree_inference_engine: bool = MODEL_TRAINER_TREE_INFERENCE_ENGINE
+    # larger batches go to sklearn, its compiled per tree loop wins once the batch amortizes the dispatch
+    tree_inference_engine_max_rows: int = MODEL_TRAINER_TREE_INFERENCE_ENGINE_MAX_ROWS
+    onnx_export: bool = MODEL_TRAINER_ONNX_EXPORT
+    onnx_model_file_path: str = os.path.join(model_trainer_dir,
+                                             MODEL_TRAINER_TRAINED_MODEL_DIR,
+                                             ONNX_MODEL_FILE_NAME)
+    onnx_min_agreement: float = MODEL_TRAINER_ONNX_MIN_AGREEMENT
     
+@dataclass
+class StorageConfig:
+    # read when the config is built, so a .env loaded after import still selects the backend
+    backend: str = field(default_factory=lambda: os.getenv(STORAGE_BACKEND_ENV_KEY,STORAGE_BACKEND))
+    local_root_dir: str = field(default_factory=lambda: os.getenv(LOCAL_STORAGE_ROOT_DIR_ENV_KEY,LOCAL_STORAGE_ROOT_DIR))
+
 @dataclass 
 class ModelEvaluationConfig:
     changed_threshold_score: float = MODEL_EVALUATION_CHANGED_THRESHOLD_SCORE
     bucket_name: str = MODEL_BUCKET_NAME
     s3_model_key_path: str = MODEL_FILE_NAME
+    release_pointer_key: str = MODEL_RELEASE_POINTER_KEY
 
 @dataclass 
 class ModelPusherConfig:
     bucket_name: str = MODEL_BUCKET_NAME
     s3_model_key_path: str = MODEL_FILE_NAME
+    s3_onnx_model_key_path: str = ONNX_MODEL_FILE_NAME
+    release_prefix: str = MODEL_PUSHER_S3_KEY
+    release_pointer_key: str = MODEL_RELEASE_POINTER_KEY
 
 @dataclass
 class USvisaPredictionConfig:
     model_file_path: str = MODEL_FILE_NAME
-    model_bucket_name: str = MODEL_BUCKET_NAME
\ No newline at end of file
+    onnx_model_file_path: str = ONNX_MODEL_FILE_NAME
+    model_bucket_name: str = MODEL_BUCKET_NAME
+    release_pointer_key: str = MODEL_RELEASE_POINTER_KEY
+    model_runtime: str = PREDICTION_MODEL_RUNTIME
+    cache_enabled: bool = PREDICTION_CACHE_ENABLED
+    cache_max_size: int = PREDICTION_CACHE_MAX_SIZE
+    cache_ttl_seconds: float = PREDICTION_CACHE_TTL_SECONDS
+    # larger frames (columnar batches) skip the cache: per row keys cost more than the model call
+    # and one batch would evict the whole cache
+    cache_max_batch_rows: int = PREDICTION_CACHE_MAX_BATCH_ROWS
+    batch_enabled: bool = PREDICTION_BATCH_ENABLED
+    batch_max_size: int = PREDICTION_BATCH_MAX_SIZE
+    batch_window_ms: float = PREDICTION_BATCH_WINDOW_MS
+    warmup_rounds: int = PREDICTION_WARMUP_ROUNDS
+    warmup_rows: int = PREDICTION_WARMUP_ROWS
+    # a failed warm-up is retried after this delay, doubled on every failure up to the max
+    warmup_retry_initial_seconds: float = PREDICTION_WARMUP_RETRY_INITIAL_SECONDS
+    warmup_retry_max_seconds: float = PREDICTION_WARMUP_RETRY_MAX_SECONDS
+
+@dataclass
+class PredictionLogConfig:
+    # off unless switched on, the serving image must start without mongodb; read when the config is built
+    enabled: bool = field(default_factory=lambda: os.getenv(PREDICTION_LOG_ENABLED_ENV_KEY,
+                                                            str(PREDICTION_LOG_ENABLED)).lower() in ("1","true","yes"))
+    database_name: str = DATABASE_NAME
+    collection_name: str = PREDICTION_LOG_COLLECTION_NAME
+    # records beyond the buffer are dropped and counted, the request path never waits on mongodb
+    max_buffer_size: int = PREDICTION_LOG_MAX_BUFFER_SIZE
+    flush_size: int = PREDICTION_LOG_FLUSH_SIZE
+    flush_interval_seconds: float = PREDICTION_LOG_FLUSH_INTERVAL_SECONDS
+    close_timeout_seconds: float = PREDICTION_LOG_CLOSE_TIMEOUT_SECONDS
+
+@dataclass
+class DriftMonitorConfig:
+    window_size: int = DRIFT_MONITOR_WINDOW_SIZE
+    check_interval: int = DRIFT_MONITOR_CHECK_INTERVAL
+    min_samples: int = DRIFT_MONITOR_MIN_SAMPLES
+    psi_threshold: float = DRIFT_MONITOR_PSI_THRESHOLD
+    epsilon: float = DRIFT_MONITOR_EPSILON
@@ -2,6 +2,7 @@ import sys
 
 import pandas as pd 
 from pandas import DataFrame
+from scipy import sparse
 from sklearn.pipeline import Pipeline
 
 from us_visa.exception.exceptions import USvisaException
@@ -23,10 +24,24 @@ class TargetValueMapping:
 class UsVisaModel:
     def __init__(self,
                  preprocessing_object: Pipeline,
-                 trained_model_object: object):
+                 trained_model_object: object,
+                 reference_profile: object = None,
+                 dense_input: bool = False,
+                 inference_engine: object = None,
+                 inference_engine_max_rows: int = 0,
+                 feature_dtype: str = None):
         
         self.preprocessing_object = preprocessing_object
         self.trained_model_object = trained_model_object
+        # training distribution of the serving features, used by the online drift monitor
+        self.reference_profile = reference_profile
+        # set when the preprocessor emits csr but the trained model needs a dense array
+        self.dense_input = dense_input
+        # flat array copy of a forest for small batches, trained_model_object stays the reference model
+        self.inference_engine = inference_engine
+        self.inference_engine_max_rows = inference_engine_max_rows
+        # dtype of the stored features the model was fitted and scored on, served features are cast to it
+        self.feature_dtype = feature_dtype
     
     def predict(self,dataframe: DataFrame) -> DataFrame:
         '''
@@ -37,6 +52,18 @@ class UsVisaModel:
             logging.info("Using the trained model to make predictions")
             transformed_feature = self.preprocessing_object.transform(dataframe)
 
+            feature_dtype = getattr(self,"feature_dtype",None)
+            if feature_dtype is not None and transformed_feature.dtype != feature_dtype:
+                transformed_feature = transformed_feature.astype(feature_dtype)
+
+            inference_engine = getattr(self,"inference_engine",None)
+            if inference_engine is not None and transformed_feature.shape[0] <= self.inference_engine_max_rows:
+                logging.info("Made predictions with the flat tree inference engine")
+                return inference_engine.predict(transformed_feature)
+
+            if getattr(self,"dense_input",False) and sparse.issparse(transformed_feature):
+                transformed_feature = transformed_feature.toarray()
+
             logging.info("Applied the preprocessing transformation pipeline on the features")
             logging.info("Made predictions with the trained model")
 
@@ -0,0 +1,117 @@
+import sys
+import json
+from functools import lru_cache
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from us_visa.constants.constant import SCHEMA_FILE_PATH, CURRENT_YEAR
+from us_visa.exception.exceptions import USvisaException
+from us_visa.utils.main_utils import read_yaml_file
+
+# marks a frame the spec already produced, so a second application on the same path is free
+FEATURE_SPEC_ATTRS_KEY: str = "feature_spec"
+
+
+class FeatureSpec:
+    '''
+    Compiled form of the feature_spec section of schema.yaml: derived columns, dropped columns and dtype casts.
+    The same spec builds the server side projection of the mongodb export and the client side transform used by
+    training, evaluation, batch scoring and the serving form. The transform is idempotent: a derived column
+    whose source is gone is passed through, and only cast
+    '''
+
+    DERIVATIONS = ("current_year_minus",)
+
+    def __init__(self, derived_columns: Dict[str, dict], drop_columns: List[str], casts: Dict[str, str]):
+        for name, derivation in derived_columns.items():
+            if len(derivation) != 1 or next(iter(derivation)) not in self.DERIVATIONS:
+                raise ValueError(f"Unsupported derivation {derivation} of {name}, expected one of {self.DERIVATIONS}")
+
+        self.derived_columns = derived_columns
+        self.drop_columns = set(drop_columns)
+        self.casts = {name: np.dtype(dtype) for name, dtype in casts.items()}
+        self.signature = json.dumps({"derived_columns": derived_columns,
+                                     "drop_columns": sorted(drop_columns),
+                                     "casts": casts}, sort_keys=True)
+
+    @classmethod
+    def from_schema(cls, schema_config: dict) -> "FeatureSpec":
+        feature_spec = schema_config.get("feature_spec", {})
+        return cls(derived_columns=feature_spec.get("derived_columns") or {},
+                   drop_columns=feature_spec.get("drop_columns") or [],
+                   casts=feature_spec.get("casts") or {})
+
+    @staticmethod
+    def _derive(derivation: dict, dataframe: DataFrame) -> pd.Series:
+        source = derivation["current_year_minus"]
+        return CURRENT_YEAR - pd.to_numeric(dataframe[source], errors="coerce")
+
+    def _cast(self, name: str, values: pd.Series) -> pd.Series:
+        dtype = self.casts.get(name)
+        if dtype is None or values.dtype == dtype:
+            return values
+        if dtype.kind in "biuf":
+            # form posts and csv text become numbers, unparsable values become missing
+            values = pd.to_numeric(values, errors="coerce")
+        return values.astype(dtype)
+
+    def transform(self, dataframe: DataFrame) -> DataFrame:
+        '''
+        Applies derivations, drops and casts in one pass over the columns and builds the result frame once
+
+        Output      :   DataFrame in the exported dataset layout
+        On Failure  :   Write an exception log and then raise an exception
+        '''
+        try:
+            if dataframe.attrs.get(FEATURE_SPEC_ATTRS_KEY) == self.signature:
+                return dataframe
+
+            columns = {}
+            for name in dataframe.columns:
+                if name in self.drop_columns:
+                    continue
+                derivation = self.derived_columns.get(name)
+                if derivation is not None and derivation["current_year_minus"] in dataframe.columns:
+                    continue
+                columns[name] = self._cast(name, dataframe[name])
+
+            for name, derivation in self.derived_columns.items():
+                if name in columns:
+                    continue
+                if derivation["current_year_minus"] not in dataframe.columns:
+                    raise ValueError(f"Cannot derive {name}, column {derivation['current_year_minus']} is missing")
+                columns[name] = self._cast(name, self._derive(derivation, dataframe))
+
+            transformed = DataFrame(columns, index=dataframe.index, copy=False)
+            transformed.attrs[FEATURE_SPEC_ATTRS_KEY] = self.signature
+            return transformed
+
+        except Exception as e:
+            raise USvisaException(str(e), sys)
+
+    def get_mongo_projection(self, columns: List[str]) -> dict:
+        '''
+        Returns the $project stage body that yields the given exported columns from a raw document,
+        derived columns are computed on the server and "na" becomes null
+        '''
+        projection = {"_id": 0}
+        for name in columns:
+            derivation = self.derived_columns.get(name)
+            if derivation is not None:
+                source = "$" + derivation["current_year_minus"]
+                projection[name] = {"$cond": [{"$isNumber": source}, {"$subtract": [CURRENT_YEAR, source]}, None]}
+            else:
+                projection[name] = {"$cond": [{"$eq": ["$" + name, "na"]}, None, "$" + name]}
+
+        return projection
+
+
+@lru_cache(maxsize=None)
+def load_feature_spec(schema_file_path: str = SCHEMA_FILE_PATH) -> FeatureSpec:
+    '''
+    Returns the feature spec of the schema file, compiled once per process
+    '''
+    return FeatureSpec.from_schema(read_yaml_file(file_path=schema_file_path))
@@ -0,0 +1,269 @@
+import sys
+import copy
+import json
+import threading
+from dataclasses import asdict
+from typing import Dict, Optional
+
+import numpy as np
+from pandas import DataFrame
+from pandas.api.types import is_numeric_dtype
+
+from us_visa.exception.exceptions import USvisaException
+from us_visa.logger.logger import logging
+from us_visa.monitoring.drift_monitor import FeatureReference, ReferenceProfile
+
+# skl2onnx (and onnxmltools for xgboost) is only needed to export, onnxruntime only to serve,
+# both are imported where they are used
+
+REFERENCE_PROFILE_METADATA_KEY: str = "reference_profile"
+
+# model families whose conversion is registered below and checked against sklearn at export,
+# any other family is not exported
+ONNX_CONVERTIBLE_MODELS = ("KNeighborsClassifier",
+                           "RandomForestClassifier",
+                           "HistGradientBoostingClassifier",
+                           "XGBClassifier")
+
+# xgboost's hist cut points are observed feature values and the graph's float32 preprocessing lands a few ulps
+# off them, its strict thresholds are lowered by this share of max(1, |threshold|) so rows on a cut split as in sklearn
+XGBOOST_THRESHOLD_TOLERANCE: float = 1e-5
+
+_converters_registered = False
+
+
+def get_onnx_unsupported_reason(usvisa_model: object, sample_df: DataFrame) -> Optional[str]:
+    '''
+    Returns why a UsVisaModel is not exported to ONNX, None when it is
+    '''
+    from scipy import sparse
+
+    model_family = type(usvisa_model.trained_model_object).__name__
+    if model_family not in ONNX_CONVERTIBLE_MODELS:
+        return f"{model_family} has no registered ONNX conversion"
+
+    if (model_family == "XGBClassifier" and not getattr(usvisa_model, "dense_input", False)
+            and sparse.issparse(usvisa_model.preprocessing_object.transform(sample_df))):
+        return "XGBClassifier treats the absent entries of sparse features as missing, the graph sees zeros"
+
+    return None
+
+
+def _with_int_attributes(converter):
+    # the skl2onnx tree converter writes python booleans into integer list attributes, which onnx rejects
+    def convert(scope, operator, container):
+        add_node = container.add_node
+
+        def add_int_node(*args, **attributes):
+            for name, value in attributes.items():
+                if isinstance(value, list) and any(isinstance(item, (bool, np.bool_)) for item in value):
+                    attributes[name] = [int(item) for item in value]
+            return add_node(*args, **attributes)
+
+        container.add_node = add_int_node
+        try:
+            converter(scope, operator, container)
+        finally:
+            del container.add_node
+
+    return convert
+
+
+def register_onnx_converters() -> None:
+    '''
+    Registers the converters skl2onnx does not ship or ships broken: xgboost through onnxmltools,
+    histogram gradient boosting with integer node attributes
+    '''
+    global _converters_registered
+    if _converters_registered:
+        return
+
+    from sklearn.ensemble import HistGradientBoostingClassifier
+    from skl2onnx import update_registered_converter
+    from skl2onnx.common.shape_calculator import calculate_linear_classifier_output_shapes
+    from skl2onnx.operator_converters.random_forest import convert_sklearn_random_forest_classifier
+
+    update_registered_converter(HistGradientBoostingClassifier,
+                                "SklearnHistGradientBoostingClassifier",
+                                calculate_linear_classifier_output_shapes,
+                                _with_int_attributes(convert_sklearn_random_forest_classifier),
+                                options={"zipmap": [True, False, "columns"],
+                                         "raw_scores": [True, False],
+                                         "nocl": [True, False]})
+
+    try:
+        from xgboost import XGBClassifier
+        from onnxmltools.convert.xgboost.operator_converters.XGBoost import convert_xgboost
+    except ImportError:
+        logging.info("xgboost or onnxmltools is not installed, XGBClassifier models are not exported to ONNX")
+    else:
+        update_registered_converter(XGBClassifier,
+                                    "XGBoostXGBClassifier",
+                                    calculate_linear_classifier_output_shapes,
+                                    convert_xgboost,
+                                    options={"zipmap": [True, False, "columns"],
+                                             "nocl": [True, False]})
+
+    _converters_registered = True
+
+
+def get_onnx_classifier(classifier: object) -> object:
+    '''
+    Returns a shallow copy of classifier prepared for conversion, the fitted model is left untouched:
+    class labels are int64, the onnx label extractors take no narrower integers, and histogram boosting thresholds
+    are rounded down to float32, so the graph's float32 comparisons split the float32 features as sklearn does
+    '''
+    classifier = copy.copy(classifier)
+    for attribute in ("classes_", "_y"):
+        labels = getattr(classifier, attribute, None)
+        if isinstance(labels, np.ndarray) and labels.dtype.kind in "iub" and labels.dtype != np.int64:
+            setattr(classifier, attribute, labels.astype(np.int64))
+
+    if hasattr(classifier, "_predictors"):
+        predictors = []
+        for iteration in classifier._predictors:
+            predictors.append([])
+            for predictor in iteration:
+                predictor = copy.copy(predictor)
+                predictor.nodes = predictor.nodes.copy()
+                thresholds = predictor.nodes["num_threshold"]
+                float32_thresholds = thresholds.astype(np.float32)
+                rounded_up = float32_thresholds.astype(np.float64) > thresholds
+                float32_thresholds[rounded_up] = np.nextafter(float32_thresholds[rounded_up], np.float32(-np.inf))
+                predictor.nodes["num_threshold"] = float32_thresholds
+                predictors[-1].append(predictor)
+        classifier._predictors = predictors
+
+    return classifier
+
+
+def lower_strict_thresholds(onnx_model: object, tolerance: float) -> None:
+    '''
+    Lowers the BRANCH_LT thresholds of every tree ensemble in onnx_model by tolerance * max(1, |threshold|)
+    '''
+    for node in onnx_model.graph.node:
+        if not node.op_type.startswith("TreeEnsemble"):
+            continue
+        attributes = {attribute.name: attribute for attribute in node.attribute}
+        modes = attributes["nodes_modes"].strings
+        values = np.array(attributes["nodes_values"].floats, dtype=np.float32)
+        strict = np.array([mode == b"BRANCH_LT" for mode in modes])
+        values[strict] -= np.float32(tolerance) * np.maximum(np.float32(1), np.abs(values[strict]))
+        del attributes["nodes_values"].floats[:]
+        attributes["nodes_values"].floats.extend(values.tolist())
+
+
+def export_usvisa_model_to_onnx(usvisa_model: object, sample_df: DataFrame) -> bytes:
+    '''
+    Converts the preprocessor and classifier of a UsVisaModel into one ONNX graph with one input per raw column.
+    The model's reference profile is stored in the graph metadata so the onnx runtime keeps drift monitoring
+
+    Output      :   Serialized ONNX model
+    On Failure  :   Write an exception log and then raise an exception
+    '''
+    try:
+        from sklearn.pipeline import Pipeline
+        from skl2onnx import convert_sklearn, get_latest_tested_opset_version
+        from skl2onnx.common.data_types import FloatTensorType, StringTensorType
+
+        unsupported_reason = get_onnx_unsupported_reason(usvisa_model, sample_df)
+        if unsupported_reason is not None:
+            raise TypeError(unsupported_reason)
+
+        classifier = usvisa_model.trained_model_object
+
+        register_onnx_converters()
+        classifier = get_onnx_classifier(classifier)
+        pipeline = Pipeline([("preprocessor", usvisa_model.preprocessing_object),
+                             ("classifier", classifier)])
+
+        initial_types = [(column, FloatTensorType([None, 1]) if is_numeric_dtype(sample_df[column])
+                          else StringTensorType([None, 1]))
+                         for column in sample_df.columns]
+
+        # onnxmltools converts xgboost up to version 3 of the ml domain
+        onnx_model = convert_sklearn(pipeline,
+                                     initial_types=initial_types,
+                                     target_opset={"": get_latest_tested_opset_version(), "ai.onnx.ml": 3},
+                                     options={id(classifier): {"zipmap": False}})
+        if type(classifier).__name__ == "XGBClassifier":
+            lower_strict_thresholds(onnx_model, XGBOOST_THRESHOLD_TOLERANCE)
+
+        reference_profile = getattr(usvisa_model, "reference_profile", None)
+        if reference_profile is not None:
+            metadata = onnx_model.metadata_props.add()
+            metadata.key = REFERENCE_PROFILE_METADATA_KEY
+            metadata.value = json.dumps(asdict(reference_profile))
+
+        return onnx_model.SerializeToString()
+
+    except Exception as e:
+        raise USvisaException(str(e), sys)
+
+
+class OnnxUsVisaModel:
+    '''
+    Serves an exported UsVisaModel graph through a CPU onnxruntime session.
+    Input columns are copied into per column buffers that are kept between calls and only grow
+    '''
+
+    def __init__(self, onnx_model: bytes):
+        try:
+            import onnxruntime
+
+            session_options = onnxruntime.SessionOptions()
+            session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+            self.session = onnxruntime.InferenceSession(onnx_model,
+                                                        sess_options=session_options,
+                                                        providers=["CPUExecutionProvider"])
+
+            self.input_dtypes = {model_input.name: np.float32 if model_input.type == "tensor(float)" else object
+                                 for model_input in self.session.get_inputs()}
+            self.label_name = self.session.get_outputs()[0].name
+            self._buffers: Dict[str, np.ndarray] = {}
+            self._lock = threading.Lock()
+
+            metadata = self.session.get_modelmeta().custom_metadata_map
+            self.reference_profile: Optional[ReferenceProfile] = None
+            if REFERENCE_PROFILE_METADATA_KEY in metadata:
+                profile = json.loads(metadata[REFERENCE_PROFILE_METADATA_KEY])
+                self.reference_profile = ReferenceProfile(
+                    features={name: FeatureReference(**feature) for name, feature in profile["features"].items()},
+                    n_rows=profile["n_rows"])
+
+        except Exception as e:
+            raise USvisaException(str(e), sys)
+
+    def _fill_buffers(self, dataframe: DataFrame) -> dict:
+        n_rows = len(dataframe)
+        feeds = {}
+        for name, dtype in self.input_dtypes.items():
+            buffer = self._buffers.get(name)
+            if buffer is None or buffer.shape[0] < n_rows:
+                capacity = max(n_rows, 2 * buffer.shape[0] if buffer is not None else 1)
+                buffer = self._buffers[name] = np.empty((capacity, 1), dtype=dtype)
+
+            values = dataframe[name].to_numpy()
+            buffer[:n_rows, 0] = values if dtype is np.float32 else values.astype(str)
+            feeds[name] = buffer[:n_rows]
+
+        return feeds
+
+    def predict(self, dataframe: DataFrame) -> np.ndarray:
+        '''
+        To make predictions on raw serving features, the same contract as UsVisaModel.predict
+        '''
+        try:
+            logging.info("Using the onnx runtime session to make predictions")
+            with self._lock:
+                feeds = self._fill_buffers(dataframe)
+                return self.session.run([self.label_name], feeds)[0]
+
+        except Exception as e:
+            raise USvisaException(str(e), sys)
+
+    def __repr__(self):
+        return "OnnxUsVisaModel()"
+
+    def __str__(self):
+        return "OnnxUsVisaModel()"
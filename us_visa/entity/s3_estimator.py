@@ -1,41 +1,142 @@
+import os
 import sys 
+import tempfile
+import uuid
+from datetime import datetime
+from typing import Dict, Optional, Union
+
 from pandas import DataFrame 
 
-from us_visa.cloud_storage.aws_storage import SimpleStorageService
+from us_visa.cloud_storage.storage_backend import StorageBackend,get_storage_backend
 from us_visa.exception.exceptions import USvisaException
+from us_visa.logger.logger import logging
 from us_visa.entity.estimator import UsVisaModel
+from us_visa.entity.onnx_estimator import OnnxUsVisaModel
 
 class USvisaEstimator:
     '''
-    This class is used to save and retrieve the us_visa model in s3 bucket and make prediction
+    This class is used to save and retrieve the us_visa model in the model registry bucket and make prediction,
+    the registry is on s3 or a local volume as the storage config selects.
+    A push writes the model files under a new release prefix and then replaces the release pointer, readers
+    resolve the pointer once and read immutable files, so a model, its onnx graph and its version always match
     '''
 
-    def __init__(self,bucket_name,model_path):
+    def __init__(self,bucket_name,model_path,onnx_model_path=None,runtime="sklearn",storage: StorageBackend=None,
+                 release_pointer_key: Optional[str]=None):
         '''
         Docstring for __init__
 
         :param bucket_name: Name of the model bucket
-        :param model_path: Location of the model in bucket
+        :param model_path: Location of the model in a release, or in bucket when the bucket has no release pointer
+        :param onnx_model_path: Location of the exported onnx graph next to the model
+        :param runtime: sklearn serves the pickle, onnx serves the onnx graph when the release has one
+        :param storage: storage backend of the registry, the configured one by default
+        :param release_pointer_key: key holding the prefix of the current release, None reads model_path directly
         '''
         self.bucket_name = bucket_name 
-        self.s3 = SimpleStorageService()
+        self.storage = storage or get_storage_backend()
         self.model_path = model_path
-        self.loaded_model: UsVisaModel=None
+        self.onnx_model_path = onnx_model_path
+        self.runtime = runtime
+        self.release_pointer_key = release_pointer_key
+        self.loaded_model: Union[UsVisaModel,OnnxUsVisaModel]=None
+        self.model_version: str = None
 
     def is_model_present(self,model_path):
         try:
-            return self.s3.s3_key_path_available(bucket_name=self.bucket_name,
-                                                 s3_key=model_path)
+            return self.storage.key_path_available(bucket_name=self.bucket_name,
+                                                   key=model_path)
         except USvisaException as e:
             print(str(e))
             return False
     
-    def load_model(self) -> UsVisaModel:
+    def get_release(self) -> Optional[str]:
+        '''
+        Returns the prefix of the current release, None when the bucket has no release pointer
+        '''
+        if self.release_pointer_key is None or not self.is_model_present(self.release_pointer_key):
+            return None
+        return self.storage.read_file(self.release_pointer_key,bucket_name=self.bucket_name).decode().strip()
+
+    def is_registered(self) -> bool:
+        '''
+        Returns True when the bucket has a release or a model at model_path
+        '''
+        return self.get_release() is not None or self.is_model_present(self.model_path)
+
+    def get_served_model_path(self,release: Optional[str] = None) -> str:
+        '''
+        Returns the onnx graph path with the onnx runtime when the release has one, the pickle path otherwise
+        '''
+        model_path = self.model_path if release is None else f"{release}/{self.model_path}"
+        if self.runtime == "onnx" and self.onnx_model_path is not None:
+            onnx_model_path = self.onnx_model_path if release is None else f"{release}/{self.onnx_model_path}"
+            if self.is_model_present(onnx_model_path):
+                return onnx_model_path
+            logging.info(f"No onnx model at {onnx_model_path}, serving the pickled model")
+        
+        return model_path
+
+    def get_model_version(self,model_path: str = None) -> str:
+        '''
+        Returns the storage version of the model object (the s3 ETag), which changes with every pushed model
+        '''
+        try:
+            return self.storage.get_object_version(model_path or self.model_path,
+                                                   bucket_name=self.bucket_name)
+        except Exception as e:
+            raise USvisaException(str(e),sys)
+
+    def read_model(self,served_model_path: str) -> Union[UsVisaModel,OnnxUsVisaModel]:
+        if self.onnx_model_path is not None and served_model_path.endswith(self.onnx_model_path):
+            return OnnxUsVisaModel(self.storage.read_file(served_model_path,bucket_name=self.bucket_name))
+        return self.storage.load_model(served_model_path,bucket_name=self.bucket_name)
+
+    def load_model(self,max_attempts: int = 3) -> Union[UsVisaModel,OnnxUsVisaModel]:
+        '''
+        Loads the model of the current release, or the onnx graph next to it with the onnx runtime,
+        and sets model_version to the release it was read from
         '''
-        Loads the model from model_path
+        release = self.get_release()
+        if release is not None:
+            model = self.read_model(self.get_served_model_path(release))
+            self.model_version = release.rsplit("/",1)[-1]
+            return model
+
+        # a bucket without releases has one mutable key, its version is read around the payload
+        for _ in range(max_attempts):
+            served_model_path = self.get_served_model_path()
+            model_version = self.get_model_version(served_model_path)
+            model = self.read_model(served_model_path)
+            if self.get_model_version(served_model_path) == model_version:
+                self.model_version = model_version
+                return model
+            logging.info(f"{served_model_path} was replaced while it was loaded, reading it again")
+
+        raise USvisaException(f"{self.model_path} kept changing over {max_attempts} loads",sys)
+
+    def publish_release(self,files: Dict[str,str],release_prefix: str) -> str:
         '''
-        return self.s3.load_model(self.model_path,
-                                  bucket_name=self.bucket_name)
+        Uploads files (release relative key to local path) under a new release and then points the release pointer at it
+        
+        Output      :   Returns the prefix of the new release
+        On Failure  :   Write an exception log and then raise an exception, the previous release stays current
+        '''
+        try:
+            release = f"{release_prefix}/{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+            for key,from_file in files.items():
+                self.storage.upload_file(from_file,to_filename=f"{release}/{key}",bucket_name=self.bucket_name,remove=False)
+
+            fd,pointer_file = tempfile.mkstemp(suffix=".release")
+            with os.fdopen(fd,"w") as f:
+                f.write(release)
+            self.storage.upload_file(pointer_file,to_filename=self.release_pointer_key,bucket_name=self.bucket_name,remove=True)
+
+            logging.info(f"Published release {release} with {sorted(files)}")
+            return release
+
+        except Exception as e:
+            raise USvisaException(str(e),sys)
 
     def save_model(self,from_file,remove: bool=False) -> None:
         '''
@@ -44,10 +145,10 @@ class USvisaEstimator:
         :param remove: By default it is false that mean you will have your model locally available in your system folder
         '''
         try:
-            self.s3.upload_file(from_file,
-                                to_filename=self.model_path,
-                                bucket_name=self.bucket_name,
-                                remove=remove)
+            self.storage.upload_file(from_file,
+                                     to_filename=self.model_path,
+                                     bucket_name=self.bucket_name,
+                                     remove=remove)
         except Exception as e:
             raise USvisaException(str(e),sys)
         
@@ -0,0 +1,143 @@
+import sys
+
+import numpy as np
+from scipy import sparse
+from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+
+from us_visa.exception.exceptions import USvisaException
+
+
+class FlatTreeEnsemble:
+    '''
+    Inference engine for fitted forest classifiers.
+    All trees are stored in one set of flat node arrays and a batch is routed through every tree at once,
+    one vectorized step per tree level, instead of sklearn's per tree dispatch.
+    Probabilities follow sklearn's arithmetic step by step, so outputs are bit identical to the source forest
+    '''
+
+    SUPPORTED_MODELS = (RandomForestClassifier, ExtraTreesClassifier)
+
+    def __init__(self,
+                 feature: np.ndarray,
+                 threshold: np.ndarray,
+                 left: np.ndarray,
+                 right: np.ndarray,
+                 missing_go_to_left: np.ndarray,
+                 leaf_values: np.ndarray,
+                 roots: np.ndarray,
+                 max_depth: int,
+                 classes: np.ndarray,
+                 n_features: int):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.missing_go_to_left = missing_go_to_left
+        self.leaf_values = leaf_values
+        self.roots = roots
+        self.max_depth = max_depth
+        self.classes_ = classes
+        self.n_features = n_features
+
+    @classmethod
+    def is_supported(cls, model: object) -> bool:
+        return isinstance(model, cls.SUPPORTED_MODELS) and getattr(model, "n_outputs_", 1) == 1
+
+    @classmethod
+    def from_sklearn(cls, model: object) -> "FlatTreeEnsemble":
+        '''
+        Converts a fitted single output forest classifier into flat node arrays
+
+        Output      :   FlatTreeEnsemble holding every tree of the forest
+        On Failure  :   Write an exception log and then raise an exception
+        '''
+        try:
+            if not cls.is_supported(model):
+                raise ValueError(f"{type(model).__name__} is not a supported single output forest classifier")
+
+            n_classes = len(model.classes_)
+            features, thresholds, lefts, rights, missing, values, roots = [], [], [], [], [], [], []
+            offset = 0
+
+            for estimator in model.estimators_:
+                tree = estimator.tree_
+                node_ids = np.arange(tree.node_count)
+                is_leaf = tree.children_left == -1
+
+                # leaves point at themselves, so extra traversal steps keep a finished row in place
+                features.append(np.where(is_leaf, 0, tree.feature))
+                thresholds.append(tree.threshold)
+                lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+                rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+                missing.append(np.asarray(getattr(tree, "missing_go_to_left", np.zeros(tree.node_count)), dtype=bool))
+
+                # DecisionTreeClassifier.predict_proba normalizes the leaf value, done here once per leaf
+                proba = tree.value[:, 0, :n_classes].copy()
+                normalizer = proba.sum(axis=1)
+                normalizer[normalizer == 0.0] = 1.0
+                proba /= normalizer[:, np.newaxis]
+                values.append(proba)
+
+                roots.append(offset)
+                offset += tree.node_count
+
+            return cls(feature=np.ascontiguousarray(np.concatenate(features), dtype=np.intp),
+                       threshold=np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float64),
+                       left=np.ascontiguousarray(np.concatenate(lefts), dtype=np.intp),
+                       right=np.ascontiguousarray(np.concatenate(rights), dtype=np.intp),
+                       missing_go_to_left=np.concatenate(missing),
+                       leaf_values=np.ascontiguousarray(np.concatenate(values), dtype=np.float64),
+                       roots=np.asarray(roots, dtype=np.intp),
+                       max_depth=max(estimator.tree_.max_depth for estimator in model.estimators_),
+                       classes=model.classes_,
+                       n_features=model.n_features_in_)
+
+        except Exception as e:
+            raise USvisaException(str(e), sys)
+
+    def apply(self, X) -> np.ndarray:
+        '''
+        Returns the leaf reached in every tree, shape (n_trees, n_rows)
+        '''
+        # sklearn trees compare float32 features against float64 thresholds
+        if sparse.issparse(X):
+            X = X.toarray()
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"Expected {self.n_features} features, got array of shape {X.shape}")
+
+        n_rows = X.shape[0]
+        nodes = np.repeat(self.roots, n_rows)
+        rows = np.tile(np.arange(n_rows), len(self.roots))
+        has_missing = bool(np.isnan(X).any())
+
+        # only (tree, row) pairs still on an internal node take the next step
+        active = np.arange(nodes.shape[0])
+        for _ in range(self.max_depth):
+            current = nodes[active]
+            x = X[rows[active], self.feature[current]]
+            go_left = x <= self.threshold[current]
+            if has_missing:
+                go_left = np.where(np.isnan(x), self.missing_go_to_left[current], go_left)
+            following = np.where(go_left, self.left[current], self.right[current])
+            nodes[active] = following
+
+            active = active[following != current]
+            if active.shape[0] == 0:
+                break
+
+        return nodes.reshape(len(self.roots), n_rows)
+
+    def predict_proba(self, X) -> np.ndarray:
+        leaves = self.apply(X)
+
+        # summed tree by tree in estimator order, then averaged, the same float operations as the forest
+        proba = np.zeros((leaves.shape[1], self.leaf_values.shape[1]), dtype=np.float64)
+        for tree_leaves in leaves:
+            proba += self.leaf_values[tree_leaves]
+        proba /= len(self.roots)
+
+        return proba
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
@@ -13,8 +13,9 @@ os.makedirs(log_path,exist_ok=True)
 
 LOG_FILEPATH = os.path.join(log_path,LOG_FILE)
 
+# delay=True opens the log file on the first record instead of at import time
 logging.basicConfig(level=logging.INFO,
-                    filename=LOG_FILEPATH,
+                    handlers=[logging.FileHandler(LOG_FILEPATH,delay=True)],
                     format = "[%(asctime)s] %(lineno)d %(name)s - %(levelname)s - %(message)s")
 
 logs_path = os.path.join(from_root(),log_dir,LOG_FILE)
@@ -0,0 +1,293 @@
+import sys
+import math
+import threading
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from us_visa.entity.config_entity import DriftMonitorConfig
+from us_visa.exception.exceptions import USvisaException
+from us_visa.logger.logger import logging
+
+CATEGORICAL: str = "categorical"
+NUMERICAL: str = "numerical"
+
+
+@dataclass
+class FeatureReference:
+    '''
+    Training distribution of one serving feature.
+    bins holds the category values (categorical) or the bin edges (numerical)
+    '''
+    name: str
+    kind: str
+    bins: list
+    proportions: List[float]
+    null_rate: float = 0.0
+
+
+@dataclass
+class ReferenceProfile:
+    features: Dict[str, FeatureReference] = field(default_factory=dict)
+    n_rows: int = 0
+
+
+def build_reference_profile(df: DataFrame,
+                            categorical_columns: list,
+                            numerical_columns: list,
+                            n_bins: int) -> ReferenceProfile:
+    '''
+    Builds the per feature reference distribution the drift monitor compares live traffic against
+
+    Output      :   ReferenceProfile with category shares and quantile bin shares
+    On Failure  :   Write an exception log and then raise an exception
+    '''
+    try:
+        profile = ReferenceProfile(n_rows=len(df))
+
+        for column in categorical_columns:
+            values = df[column]
+            shares = values.value_counts(normalize=True, dropna=True)
+            profile.features[column] = FeatureReference(name=column,
+                                                        kind=CATEGORICAL,
+                                                        bins=[str(v) for v in shares.index],
+                                                        proportions=[float(p) for p in shares.values],
+                                                        null_rate=float(values.isna().mean()))
+
+        for column in numerical_columns:
+            values = pd.to_numeric(df[column], errors="coerce")
+            present = values.dropna().to_numpy(dtype=float)
+            edges = np.unique(np.quantile(present, np.linspace(0, 1, n_bins + 1)))
+            # the same right-closed search the live sketch uses, top edge folded into the last bin
+            idx = np.clip(np.searchsorted(edges[1:-1], present, side="right"), 0, max(len(edges) - 2, 0))
+            counts = np.bincount(idx, minlength=max(len(edges) - 1, 1))
+            profile.features[column] = FeatureReference(name=column,
+                                                        kind=NUMERICAL,
+                                                        bins=[float(e) for e in edges],
+                                                        proportions=[float(c) for c in counts / max(len(present), 1)],
+                                                        null_rate=float(values.isna().mean()))
+
+        logging.info(f"Built reference profile for {len(profile.features)} features over {profile.n_rows} rows")
+        return profile
+
+    except Exception as e:
+        raise USvisaException(str(e), sys)
+
+
+class _FeatureSketch:
+    '''
+    Fixed memory sliding window over one feature: a ring of bin indices plus running bin counts.
+    Bin layout is [regular bins..., unknown/out of range (1 or 2 slots), missing]
+    '''
+
+    def __init__(self, reference: FeatureReference, window_size: int):
+        self.reference = reference
+        self.n_regular = len(reference.proportions)
+
+        if reference.kind == CATEGORICAL:
+            self.index = {value: i for i, value in enumerate(reference.bins)}
+            self.unknown_bin = self.n_regular
+            self.missing_bin = self.n_regular + 1
+        else:
+            self.low = reference.bins[0]
+            self.high = reference.bins[-1]
+            self.inner_edges = reference.bins[1:-1]
+            self.inner_edges_array = np.asarray(self.inner_edges, dtype=float)
+            self.below_bin = self.n_regular
+            self.above_bin = self.n_regular + 1
+            self.missing_bin = self.n_regular + 2
+
+        self.counts = np.zeros(self.missing_bin + 1, dtype=np.int64)
+        self.ring = np.full(window_size, -1, dtype=np.int64)
+
+    def locate(self, value) -> int:
+        if value is None or value == "" or (isinstance(value, float) and math.isnan(value)):
+            return self.missing_bin
+
+        if self.reference.kind == CATEGORICAL:
+            return self.index.get(str(value), self.unknown_bin)
+
+        try:
+            x = float(value)
+        except (TypeError, ValueError):
+            return self.missing_bin
+        if math.isnan(x):
+            return self.missing_bin
+        if x < self.low:
+            return self.below_bin
+        if x > self.high:
+            return self.above_bin
+        return min(bisect_right(self.inner_edges, x), self.n_regular - 1)
+
+    def locate_many(self, values: pd.Series) -> np.ndarray:
+        '''
+        Vectorized locate over a column, same bins as locate value by value
+        '''
+        if self.reference.kind == CATEGORICAL:
+            missing = (values.isna() | (values.astype(str) == "")).to_numpy()
+            bins = values.astype(str).map(self.index).fillna(self.unknown_bin).to_numpy(dtype=np.int64)
+        else:
+            x = pd.to_numeric(values, errors="coerce").to_numpy(dtype=float)
+            missing = np.isnan(x)
+            bins = np.minimum(np.searchsorted(self.inner_edges_array, x, side="right"), self.n_regular - 1)
+            bins[x < self.low] = self.below_bin
+            bins[x > self.high] = self.above_bin
+
+        bins[missing] = self.missing_bin
+        return bins
+
+    def push_many(self, positions: np.ndarray, bins: np.ndarray) -> None:
+        # positions are distinct ring slots, at most one window of rows is pushed at a time
+        evicted = self.ring[positions]
+        self.counts -= np.bincount(evicted[evicted >= 0], minlength=len(self.counts))
+        self.ring[positions] = bins
+        self.counts += np.bincount(bins, minlength=len(self.counts))
+
+    def push(self, position: int, value) -> None:
+        evicted = self.ring[position]
+        if evicted >= 0:
+            self.counts[evicted] -= 1
+        b = self.locate(value)
+        self.ring[position] = b
+        self.counts[b] += 1
+
+    def score(self, filled: int, epsilon: float) -> dict:
+        missing = self.counts[self.missing_bin]
+        observed = filled - missing
+
+        if self.reference.kind == CATEGORICAL:
+            live = self.counts[:self.n_regular + 1]
+            expected = list(self.reference.proportions) + [0.0]
+            out_of_domain = self.counts[self.unknown_bin]
+        else:
+            # values outside the training range are folded into the edge bins for the psi
+            live = list(self.counts[:self.n_regular])
+            live[0] += self.counts[self.below_bin]
+            live[-1] += self.counts[self.above_bin]
+            expected = self.reference.proportions
+            out_of_domain = self.counts[self.below_bin] + self.counts[self.above_bin]
+
+        psi = 0.0
+        if observed > 0:
+            for count, ref in zip(live, expected):
+                p = max(count / observed, epsilon)
+                q = max(ref, epsilon)
+                psi += (p - q) * math.log(p / q)
+
+        return {"psi": round(psi, 6),
+                "null_rate": round(missing / filled, 6) if filled else 0.0,
+                "reference_null_rate": round(self.reference.null_rate, 6),
+                "out_of_domain_rate": round(out_of_domain / filled, 6) if filled else 0.0}
+
+
+class DriftMonitor:
+    '''
+    Streaming drift and data quality monitor for the inputs served by the prediction api.
+    Each update is O(number of features) with bounded memory, scores are recomputed every check_interval updates
+    '''
+
+    def __init__(self, drift_monitor_config: DriftMonitorConfig = DriftMonitorConfig()):
+        self.drift_monitor_config = drift_monitor_config
+        self.reference: Optional[ReferenceProfile] = None
+        self._sketches: Dict[str, _FeatureSketch] = {}
+        self._position = 0
+        self._filled = 0
+        self._seen = 0
+        self._last_report: Optional[dict] = None
+        self._lock = threading.Lock()
+
+    def set_reference(self, reference: Optional[ReferenceProfile]) -> None:
+        '''
+        Binds the monitor to a model's training reference; the window restarts whenever the reference changes
+        '''
+        if reference is None or reference is self.reference:
+            return
+
+        with self._lock:
+            window_size = self.drift_monitor_config.window_size
+            self.reference = reference
+            self._sketches = {name: _FeatureSketch(feature, window_size)
+                              for name, feature in reference.features.items()}
+            self._position = 0
+            self._filled = 0
+            self._seen = 0
+            self._last_report = None
+            logging.info(f"Drift monitor bound to reference profile of {reference.n_rows} rows")
+
+    def update(self, record: dict) -> None:
+        '''
+        Adds one served input record (feature name -> raw value) to the sliding window
+        '''
+        if self.reference is None:
+            return
+
+        with self._lock:
+            for name, sketch in self._sketches.items():
+                sketch.push(self._position, record.get(name))
+
+            self._position = (self._position + 1) % self.drift_monitor_config.window_size
+            self._filled = min(self._filled + 1, self.drift_monitor_config.window_size)
+            self._seen += 1
+
+            if self._seen % self.drift_monitor_config.check_interval == 0:
+                self._last_report = self._compute_report()
+
+    def update_batch(self, dataframe: DataFrame) -> None:
+        '''
+        Adds every row of a served batch to the sliding window with column wise numpy operations,
+        equivalent to calling update row by row
+        '''
+        if self.reference is None or len(dataframe) == 0:
+            return
+
+        with self._lock:
+            window_size = self.drift_monitor_config.window_size
+            n_rows = len(dataframe)
+            # only the last window_size rows can still be in the window afterwards
+            kept = dataframe.iloc[-window_size:] if n_rows > window_size else dataframe
+            start = self._position + n_rows - len(kept)
+            positions = (start + np.arange(len(kept))) % window_size
+
+            for name, sketch in self._sketches.items():
+                values = kept[name] if name in kept.columns else pd.Series([None] * len(kept), dtype=object)
+                sketch.push_many(positions, sketch.locate_many(values))
+
+            self._position = (self._position + n_rows) % window_size
+            self._filled = min(self._filled + n_rows, window_size)
+            seen_before = self._seen
+            self._seen += n_rows
+
+            if self._seen // self.drift_monitor_config.check_interval != seen_before // self.drift_monitor_config.check_interval:
+                self._last_report = self._compute_report()
+
+    def _compute_report(self) -> dict:
+        config = self.drift_monitor_config
+        features = {name: sketch.score(self._filled, config.epsilon)
+                    for name, sketch in self._sketches.items()}
+        drifted = [name for name, scores in features.items() if scores["psi"] >= config.psi_threshold]
+        enough_samples = self._filled >= config.min_samples
+
+        return {"window_size": self._filled,
+                "requests_seen": self._seen,
+                "psi_threshold": config.psi_threshold,
+                "drifted_columns": drifted,
+                "drifted_share": round(len(drifted) / len(features), 6) if features else 0.0,
+                "drift_detected": enough_samples and len(drifted) > 0,
+                "enough_samples": enough_samples,
+                "features": features}
+
+    def get_drift_report(self) -> dict:
+        '''
+        Returns the latest drift scores, computing them once if no periodic check has run yet
+        '''
+        if self.reference is None:
+            return {"status": "no reference profile loaded"}
+
+        with self._lock:
+            if self._last_report is None and self._filled > 0:
+                self._last_report = self._compute_report()
+            return self._last_report or {"status": "no traffic observed yet"}
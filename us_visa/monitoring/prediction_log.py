@@ -0,0 +1,170 @@
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import numpy as np
+from pandas import DataFrame
+
+from us_visa.entity.config_entity import PredictionLogConfig
+from us_visa.exception.exceptions import USvisaException
+from us_visa.logger.logger import logging
+
+
+class PredictionLogSink:
+    '''
+    Audit log of the predictions served by the api, written to mongodb in the background.
+    log() only appends the request's frame to a bounded in-memory buffer; a writer thread turns the buffered
+    rows into documents and drains them with one insert_many per flush_size rows or flush_interval_seconds,
+    whichever comes first, through the pooled MongoDBClient.
+    When the buffer is full new rows are dropped and counted instead of slowing the request down
+    '''
+
+    def __init__(self, prediction_log_config: PredictionLogConfig = PredictionLogConfig()):
+        self.prediction_log_config = prediction_log_config
+        # (dataframe, predictions, model_version, latency_ms, timestamp) per logged request
+        self._buffer: deque = deque()
+        self._buffered_rows = 0
+        self._condition = threading.Condition()
+        self._writer: Optional[threading.Thread] = None
+        self._closing = False
+        self._collection = None
+        self.logged = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.flushes = 0
+
+    def _ensure_writer(self) -> None:
+        if self._writer is None or not self._writer.is_alive():
+            self._writer = threading.Thread(target=self._run, name="prediction-log-writer", daemon=True)
+            self._writer.start()
+
+    def log(self, dataframe: DataFrame, predictions: np.ndarray, model_version: Optional[str], latency_ms: float) -> None:
+        '''
+        Buffers the rows of dataframe with their predictions, never blocks on the database.
+        The frame is kept by reference and must not be modified afterwards
+        '''
+        if not self.prediction_log_config.enabled:
+            return
+
+        n_rows = len(dataframe)
+        with self._condition:
+            if self._closing or self._buffered_rows + n_rows > self.prediction_log_config.max_buffer_size:
+                self.dropped += n_rows
+                return
+            self._buffer.append((dataframe, predictions, model_version, latency_ms, datetime.now(timezone.utc)))
+            self._buffered_rows += n_rows
+            self.logged += n_rows
+            if self._buffered_rows >= self.prediction_log_config.flush_size:
+                self._condition.notify()
+
+        self._ensure_writer()
+
+    def start(self) -> None:
+        '''
+        Resolves the log collection when the sink is enabled, so a server that cannot write its audit log
+        fails at startup instead of counting every flush as failed
+        '''
+        try:
+            if self.prediction_log_config.enabled:
+                # the client connects lazily, a ping checks the server is reachable now
+                self._get_collection().database.client.admin.command("ping")
+                logging.info(f"Logging predictions to {self.prediction_log_config.database_name}."
+                             f"{self.prediction_log_config.collection_name}")
+
+        except Exception as e:
+            raise USvisaException(f"Prediction log is enabled but mongodb is not reachable: {e}", sys)
+
+    def _get_collection(self):
+        if self._collection is None:
+            from us_visa.configuration.mongo_db_connection import MongoDBClient
+
+            mongo_client = MongoDBClient(database_name=self.prediction_log_config.database_name)
+            self._collection = mongo_client.database[self.prediction_log_config.collection_name]
+        return self._collection
+
+    def _take_batch(self) -> List[tuple]:
+        with self._condition:
+            deadline = time.monotonic() + self.prediction_log_config.flush_interval_seconds
+            while self._buffered_rows < self.prediction_log_config.flush_size and not self._closing:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                self._condition.wait(timeout)
+
+            batch, n_rows = [], 0
+            while self._buffer and n_rows < self.prediction_log_config.flush_size:
+                entry = self._buffer.popleft()
+                batch.append(entry)
+                n_rows += len(entry[0])
+            self._buffered_rows -= n_rows
+            return batch
+
+    @staticmethod
+    def to_documents(batch: List[tuple]) -> List[dict]:
+        documents = []
+        for dataframe, predictions, model_version, latency_ms, timestamp in batch:
+            for inputs, prediction in zip(dataframe.to_dict(orient="records"), predictions):
+                documents.append({"timestamp": timestamp,
+                                  "inputs": inputs,
+                                  "prediction": prediction.item() if hasattr(prediction, "item") else prediction,
+                                  "model_version": model_version,
+                                  "latency_ms": round(latency_ms, 3)})
+        return documents
+
+    def _write(self, batch: List[tuple]) -> None:
+        n_rows = sum(len(entry[0]) for entry in batch)
+        try:
+            # unordered lets the server keep inserting past a bad document
+            self._get_collection().insert_many(self.to_documents(batch), ordered=False)
+            self.written += n_rows
+        except Exception as e:
+            self.failed += n_rows
+            self._collection = None
+            logging.info(f"Writing {n_rows} prediction log records failed: {e}")
+        self.flushes += 1
+
+    def _run(self) -> None:
+        while True:
+            batch = self._take_batch()
+            if batch:
+                self._write(batch)
+            elif self._closing:
+                return
+
+    def close(self) -> None:
+        '''
+        Flushes what is buffered, waiting at most close_timeout_seconds, and stops the writer
+        '''
+        try:
+            with self._condition:
+                self._closing = True
+                self._condition.notify()
+
+            if self._writer is not None:
+                self._writer.join(self.prediction_log_config.close_timeout_seconds)
+
+            with self._condition:
+                if self._buffer:
+                    logging.info(f"Dropping {self._buffered_rows} unwritten prediction log records on shutdown")
+                    self.dropped += self._buffered_rows
+                    self._buffer.clear()
+                    self._buffered_rows = 0
+
+        except Exception as e:
+            raise USvisaException(str(e), sys)
+
+    def get_stats(self) -> dict:
+        with self._condition:
+            buffered = self._buffered_rows
+        return {"enabled": self.prediction_log_config.enabled,
+                "logged": self.logged,
+                "written": self.written,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "flushes": self.flushes,
+                "buffered": buffered,
+                "max_buffer_size": self.prediction_log_config.max_buffer_size}
@@ -0,0 +1,113 @@
+import asyncio
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from us_visa.logger.logger import logging
+
+
+class PredictionBatcher:
+    '''
+    Collects concurrent prediction requests for up to window_ms (or max_batch_size rows) and runs
+    one vectorized predict over the stacked rows, then hands each caller its own slice of the result.
+    When the server is idle a lone request is flushed at once instead of waiting out the window
+    '''
+
+    def __init__(self,
+                 predict_fn: Callable[[DataFrame], np.ndarray],
+                 max_batch_size: int,
+                 window_ms: float):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.window_seconds = window_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._last_batch_size = 0
+        self.batches = 0
+        self.rows = 0
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def predict(self, dataframe: DataFrame) -> np.ndarray:
+        '''
+        Queues the rows of dataframe and waits for their predictions
+        '''
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((dataframe, future))
+        return await future
+
+    async def _collect(self) -> List[Tuple[DataFrame, asyncio.Future]]:
+        batch = [await self._queue.get()]
+        n_rows = len(batch[0][0])
+
+        if self._last_batch_size <= 1 and self._queue.empty():
+            return batch
+
+        deadline = asyncio.get_running_loop().time() + self.window_seconds
+        while n_rows < self.max_batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            n_rows += len(item[0])
+
+        return batch
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            self._last_batch_size = len(batch)
+            frames = [dataframe for dataframe, _ in batch]
+
+            try:
+                stacked = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+                # the model call is cpu bound, keep it off the event loop so new requests keep queueing
+                predictions = await loop.run_in_executor(None, self.predict_fn, stacked)
+            except Exception as e:
+                logging.info(f"Batched prediction of {len(frames)} requests failed, retrying them one by one: {e}")
+                await self._predict_each(batch)
+                continue
+
+            self.batches += 1
+            self.rows += len(stacked)
+
+            start = 0
+            for dataframe, future in batch:
+                end = start + len(dataframe)
+                if not future.done():
+                    future.set_result(predictions[start:end])
+                start = end
+
+    async def _predict_each(self, batch: List[Tuple[DataFrame, asyncio.Future]]) -> None:
+        # a malformed request only fails its own caller, the requests batched with it still get predictions
+        loop = asyncio.get_running_loop()
+        for dataframe, future in batch:
+            try:
+                predictions = await loop.run_in_executor(None, self.predict_fn, dataframe)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.rows += len(dataframe)
+            if not future.done():
+                future.set_result(predictions)
+
+    def get_stats(self) -> dict:
+        return {"batches": self.batches,
+                "rows": self.rows,
+                "mean_batch_rows": round(self.rows / self.batches, 3) if self.batches else 0.0,
+                "max_batch_size": self.max_batch_size,
+                "window_ms": self.window_seconds * 1000}
@@ -0,0 +1,94 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Hashable, List, Optional
+
+from pandas import DataFrame
+
+from us_visa.logger.logger import logging
+
+
+class PredictionCache:
+    '''
+    Size bounded LRU cache of single row predictions with an optional time to live.
+    Entries belong to one model version, the cache empties itself when the served version changes
+    '''
+
+    def __init__(self, max_size: int, ttl_seconds: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.model_version: Optional[str] = None
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _normalize(value) -> Hashable:
+        # form posts send numbers as text, so "2100" and 2100 must map to the same key
+        if isinstance(value, str):
+            value = value.strip()
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return str(value)
+
+    def make_keys(self, dataframe: DataFrame) -> List[tuple]:
+        '''
+        Builds one normalized feature tuple per row, independent of the column order
+        '''
+        columns = sorted(dataframe.columns)
+        return [tuple(self._normalize(v) for v in row)
+                for row in dataframe[columns].itertuples(index=False, name=None)]
+
+    def set_model_version(self, model_version: Optional[str]) -> None:
+        with self._lock:
+            if model_version != self.model_version:
+                if self._entries:
+                    logging.info(f"Model version changed to {model_version}, "
+                                 f"dropping {len(self._entries)} cached predictions")
+                self._entries.clear()
+                self.model_version = model_version
+
+    def get(self, key: tuple):
+        '''
+        Returns the cached prediction or None on a miss
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+            self.misses += 1
+            return None
+
+    def put(self, key: tuple, value) -> None:
+        with self._lock:
+            expires_at = None if self.ttl_seconds is None else time.monotonic() + self.ttl_seconds
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {"model_version": self.model_version,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 6) if lookups else 0.0}
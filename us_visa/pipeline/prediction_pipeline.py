@@ -1,5 +1,6 @@
 import os 
 import sys 
+import time
 
 import numpy as np 
 import pandas as pd 
@@ -7,9 +8,12 @@ from pandas import DataFrame
 
 from us_visa.entity.config_entity import USvisaPredictionConfig
 from us_visa.entity.s3_estimator import USvisaEstimator
+from us_visa.entity.feature_spec import load_feature_spec
+from us_visa.pipeline.prediction_cache import PredictionCache
 from us_visa.exception.exceptions import USvisaException
 from us_visa.logger.logger import logging 
 from us_visa.utils.main_utils import read_yaml_file
+from us_visa.constants.constant import SCHEMA_FILE_PATH
 
 class USvisaData:
     def __init__(self,
@@ -44,7 +48,7 @@ class USvisaData:
         '''
         try:
             usvisa_input_dict = self.get_usvisa_data_as_dict()
-            return DataFrame(usvisa_input_dict)
+            return load_feature_spec().transform(DataFrame(usvisa_input_dict))
         
         except Exception as e:
             raise USvisaException(str(e),sys)
@@ -81,25 +85,138 @@ class USvisaClassifier:
         '''
         try:
             self.prediction_pipeline_config = prediction_pipeline_config
+            self.usvisa_estimator: USvisaEstimator = None
+            self.prediction_cache: PredictionCache = None
+
+            if prediction_pipeline_config.cache_enabled:
+                self.prediction_cache = PredictionCache(max_size=prediction_pipeline_config.cache_max_size,
+                                                        ttl_seconds=prediction_pipeline_config.cache_ttl_seconds)
+        except Exception as e:
+            raise USvisaException(str(e),sys)
+        
+    def get_estimator(self) -> USvisaEstimator:
+        '''
+        Returns the s3 estimator, created once so the loaded model is reused across predictions
+        '''
+        if self.usvisa_estimator is None:
+            self.usvisa_estimator = USvisaEstimator(
+                bucket_name=self.prediction_pipeline_config.model_bucket_name,
+                model_path=self.prediction_pipeline_config.model_file_path,
+                onnx_model_path=self.prediction_pipeline_config.onnx_model_file_path,
+                runtime=self.prediction_pipeline_config.model_runtime,
+                release_pointer_key=self.prediction_pipeline_config.release_pointer_key
+            )
+        return self.usvisa_estimator
+
+    def load_model(self) -> None:
+        '''
+        Fetches the current model from s3 if it is not loaded yet
+        '''
+        try:
+            estimator = self.get_estimator()
+            if estimator.loaded_model is None:
+                estimator.loaded_model = estimator.load_model()
+        
+        except Exception as e:
+            raise USvisaException(str(e),sys)
+
+    def get_warmup_data_frame(self) -> DataFrame:
+        '''
+        Builds synthetic applicants that cycle through the schema's category domains,
+        numeric values are taken from the model's reference bins when available
+        '''
+        try:
+            schema_config = read_yaml_file(file_path=SCHEMA_FILE_PATH)
+            reference_profile = self.get_reference_profile()
+            n_rows = self.prediction_pipeline_config.warmup_rows
+
+            warmup_data = {}
+            for column in schema_config["oh_columns"] + schema_config["or_columns"]:
+                domain = schema_config["domains"][column]
+                warmup_data[column] = [domain[i % len(domain)] for i in range(n_rows)]
+
+            for column in schema_config["num_features"]:
+                if reference_profile is not None and column in reference_profile.features:
+                    values = reference_profile.features[column].bins
+                else:
+                    values = [schema_config.get("ranges",{}).get(column,{}).get("min",1)]
+                warmup_data[column] = [values[i % len(values)] for i in range(n_rows)]
+
+            return DataFrame(warmup_data)
+        
+        except Exception as e:
+            raise USvisaException(str(e),sys)
+
+    def warm_up(self) -> float:
+        '''
+        Loads the model and runs single row and batch predictions so the first real requests
+        do not pay for the s3 fetch, unpickling and first call initialization
+
+        Return: Warm-up duration in seconds
+        '''
+        try:
+            start = time.perf_counter()
+            self.load_model()
+            warmup_df = self.get_warmup_data_frame()
+            estimator = self.get_estimator()
+
+            # the estimator is called directly so synthetic rows never enter the prediction cache
+            for _ in range(self.prediction_pipeline_config.warmup_rounds):
+                estimator.predict(warmup_df.iloc[:1])
+                estimator.predict(warmup_df)
+
+            duration = time.perf_counter() - start
+            logging.info(f"Warmed up model version {estimator.model_version} in {duration:.3f}s")
+            return duration
+        
         except Exception as e:
             raise USvisaException(str(e),sys)
+
+    def reload_model(self) -> None:
+        '''
+        Drops the loaded model so the next prediction fetches the current one from s3
+        '''
+        if self.usvisa_estimator is not None:
+            self.usvisa_estimator.loaded_model = None
+            self.usvisa_estimator.model_version = None
+
+    def get_reference_profile(self):
+        '''
+        Return: Training reference profile carried by the served model, None for models trained without one
+        '''
+        try:
+            self.load_model()
+            return getattr(self.get_estimator().loaded_model,"reference_profile",None)
         
+        except Exception as e:
+            raise USvisaException(str(e),sys)
     
     def predict(self,dataframe) -> str: 
         '''
         Return: Prediction in string format
         '''
         try:
-            model = USvisaEstimator(
-                bucket_name=self.prediction_pipeline_config.model_bucket_name,
-                model_path=self.prediction_pipeline_config.model_file_path
-            )
+            model = self.get_estimator()
+            # batch scoring input may be raw records, frames from USvisaData pass through untouched
+            dataframe = load_feature_spec().transform(dataframe)
+
+            if self.prediction_cache is None or len(dataframe) > self.prediction_pipeline_config.cache_max_batch_rows:
+                return model.predict(dataframe)
 
-            result = model.predict(dataframe)
+            self.load_model()
+            self.prediction_cache.set_model_version(model.model_version)
 
-            return result
+            keys = self.prediction_cache.make_keys(dataframe)
+            result = [self.prediction_cache.get(key) for key in keys]
+            missing = [i for i,value in enumerate(result) if value is None]
+
+            if missing:
+                predictions = model.predict(dataframe.iloc[missing])
+                for i,value in zip(missing,predictions):
+                    result[i] = value
+                    self.prediction_cache.put(keys[i],value)
+
+            return np.asarray(result)
         
         except Exception as e:
             raise USvisaException(str(e),sys)
-
-        
\ No newline at end of file
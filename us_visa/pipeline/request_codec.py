@@ -0,0 +1,114 @@
+import sys
+import json
+from typing import Optional, Tuple
+
+import numpy as np
+from pandas import DataFrame
+
+from us_visa.exception.exceptions import USvisaException
+
+# pyarrow and msgpack are only needed by clients that send those formats, both are imported where they are used
+
+JSON_MEDIA_TYPE: str = "application/json"
+ARROW_MEDIA_TYPE: str = "application/vnd.apache.arrow.stream"
+MSGPACK_MEDIA_TYPE: str = "application/msgpack"
+
+MEDIA_TYPE_ALIASES = {"application/x-msgpack": MSGPACK_MEDIA_TYPE,
+                      "application/vnd.msgpack": MSGPACK_MEDIA_TYPE,
+                      "application/vnd.apache.arrow.file": ARROW_MEDIA_TYPE}
+
+SUPPORTED_MEDIA_TYPES = (JSON_MEDIA_TYPE, ARROW_MEDIA_TYPE, MSGPACK_MEDIA_TYPE)
+
+
+def get_media_type(content_type: Optional[str]) -> Optional[str]:
+    '''
+    Returns the supported media type named by a Content-Type or Accept header, None when it names none.
+    Parameters and q-values are ignored and the first supported entry of a list wins
+    '''
+    for entry in (content_type or "").split(","):
+        media_type = entry.split(";")[0].strip().lower()
+        media_type = MEDIA_TYPE_ALIASES.get(media_type, media_type)
+        if media_type in SUPPORTED_MEDIA_TYPES:
+            return media_type
+    return None
+
+
+def _decode_msgpack_column(values) -> object:
+    # {"dtype": "<f8", "data": <bin>} is a raw little endian buffer viewed as an array without copying,
+    # plain arrays (used for strings) decode to lists
+    if isinstance(values, dict):
+        return np.frombuffer(values["data"], dtype=np.dtype(values["dtype"]))
+    return values
+
+
+def decode_request(body: bytes, content_type: Optional[str]) -> DataFrame:
+    '''
+    Decodes a columnar prediction request into a dataframe of raw serving features.
+    json        :   {"column": [values...]} or a list of records
+    arrow       :   one Arrow IPC stream, numeric columns are handed to pandas without per row objects
+    msgpack     :   {"column": [values...] | {"dtype": ..., "data": <bin>}}
+
+    Output      :   DataFrame with one row per record
+    On Failure  :   Write an exception log and then raise an exception
+    '''
+    try:
+        media_type = get_media_type(content_type)
+
+        if media_type == ARROW_MEDIA_TYPE:
+            import pyarrow as pa
+
+            reader = pa.ipc.open_stream(pa.py_buffer(body))
+            return reader.read_all().to_pandas()
+
+        if media_type == MSGPACK_MEDIA_TYPE:
+            import msgpack
+
+            columns = msgpack.unpackb(body, raw=False)
+            return DataFrame({name: _decode_msgpack_column(values) for name, values in columns.items()}, copy=False)
+
+        if media_type == JSON_MEDIA_TYPE:
+            payload = json.loads(body)
+            return DataFrame(payload.get("columns", payload) if isinstance(payload, dict) else payload)
+
+        raise ValueError(f"Unsupported content type {content_type}, expected one of {SUPPORTED_MEDIA_TYPES}")
+
+    except Exception as e:
+        raise USvisaException(str(e), sys)
+
+
+def encode_response(predictions: np.ndarray, media_type: str) -> bytes:
+    '''
+    Encodes the predictions as a "prediction" column in the given media type
+    '''
+    try:
+        predictions = np.ascontiguousarray(predictions)
+
+        if media_type == ARROW_MEDIA_TYPE:
+            import pyarrow as pa
+
+            table = pa.table({"prediction": predictions})
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            return sink.getvalue().to_pybytes()
+
+        if media_type == MSGPACK_MEDIA_TYPE:
+            import msgpack
+
+            return msgpack.packb({"prediction": {"dtype": predictions.dtype.newbyteorder("<").str,
+                                                 "data": predictions.astype(predictions.dtype.newbyteorder("<"), copy=False).tobytes()}})
+
+        return json.dumps({"prediction": predictions.tolist()}).encode()
+
+    except Exception as e:
+        raise USvisaException(str(e), sys)
+
+
+def negotiate(content_type: Optional[str], accept: Optional[str]) -> Tuple[Optional[str], str]:
+    '''
+    Returns the request media type and the response media type: the Accept header when it names
+    a supported format, otherwise the format of the request
+    '''
+    request_media_type = get_media_type(content_type)
+    response_media_type = get_media_type(accept) or request_media_type or JSON_MEDIA_TYPE
+    return request_media_type, response_media_type
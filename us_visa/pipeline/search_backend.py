@@ -0,0 +1,74 @@
+import sys
+from contextlib import nullcontext
+from typing import List, Optional
+
+import joblib
+
+from us_visa.exception.exceptions import USvisaException
+from us_visa.logger.logger import logging
+
+
+class SearchBackend:
+    '''
+    Execution backend of the model search, selected by the search_backend section of model.yaml.
+    local keeps GridSearchCV on the joblib workers of this machine, dask sends every candidate fit
+    to a dask.distributed cluster: the one at scheduler_address, or a LocalCluster of n_workers processes
+    standing in for the nodes when no address is set. The training arrays are scattered to the workers
+    once per search instead of being pickled into every fit task.
+
+    Used as a context manager around the whole search, the cluster connection lives until the search ends
+    '''
+
+    def __init__(self, backend_config: Optional[dict] = None):
+        self.backend_config = backend_config or {}
+        self.name = self.backend_config.get("name", "local")
+        self._client = None
+        self._cluster = None
+
+    def __enter__(self) -> "SearchBackend":
+        try:
+            if self.name == "dask":
+                # dask is only needed on the machine that drives a distributed search
+                from dask.distributed import Client, LocalCluster
+
+                scheduler_address = self.backend_config.get("scheduler_address")
+                if scheduler_address is None:
+                    self._cluster = LocalCluster(n_workers=self.backend_config.get("n_workers", 2),
+                                                 threads_per_worker=self.backend_config.get("threads_per_worker", 1),
+                                                 processes=True,
+                                                 dashboard_address=None)
+                    scheduler_address = self._cluster.scheduler_address
+
+                self._client = Client(scheduler_address)
+                n_workers = len(self._client.scheduler_info()["workers"])
+                logging.info(f"Model search runs on dask cluster {scheduler_address} with {n_workers} workers")
+
+            elif self.name != "local":
+                raise ValueError(f"Unknown search backend {self.name}, expected local or dask")
+
+            return self
+
+        except Exception as e:
+            self.close()
+            raise USvisaException(str(e), sys)
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+        if self._cluster is not None:
+            self._cluster.close()
+            self._cluster = None
+
+    def parallel(self, scatter: List[object]):
+        '''
+        Returns the joblib context a search runs under
+
+        :param scatter: arrays every candidate fit reads, shipped to each worker once
+        '''
+        if self._client is None:
+            return nullcontext()
+        return joblib.parallel_backend("dask", scatter=scatter)
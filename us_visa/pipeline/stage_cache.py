@@ -0,0 +1,108 @@
+import os
+import sys
+import json
+import hashlib
+import inspect
+from dataclasses import asdict, fields, is_dataclass
+from typing import List, Optional
+
+from us_visa.entity.config_entity import StageCacheConfig
+from us_visa.exception.exceptions import USvisaException
+from us_visa.logger.logger import logging
+from us_visa.utils.main_utils import save_object, load_object
+
+
+class StageCache:
+    '''
+    Content addressed cache of pipeline stage artifacts.
+    A stage's fingerprint hashes its input files, its config values and the source of the code that runs it,
+    a stored artifact is reused while every file it points to still exists
+    '''
+
+    def __init__(self, stage_cache_config: StageCacheConfig = StageCacheConfig()):
+        self.stage_cache_config = stage_cache_config
+        self._file_hashes = {}
+
+    def hash_file(self, file_path: str) -> str:
+        stat = os.stat(file_path)
+        memo_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+        if memo_key not in self._file_hashes:
+            digest = hashlib.sha256()
+            with open(file_path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+            self._file_hashes[memo_key] = digest.hexdigest()
+        return self._file_hashes[memo_key]
+
+    @staticmethod
+    def _config_values(config: object) -> dict:
+        # paths carry the run timestamp, so only the settings take part in the fingerprint
+        values = asdict(config) if is_dataclass(config) else dict(config)
+        return {k: v for k, v in values.items() if not k.endswith(("_dir", "_path"))}
+
+    def fingerprint(self,
+                    stage: str,
+                    input_files: List[str],
+                    configs: List[object],
+                    code: List[object]) -> str:
+        '''
+        Returns the sha256 fingerprint of a stage run
+
+        :param input_files: data and config files the stage reads
+        :param configs: config dataclasses or plain dicts of settings
+        :param code: classes or modules whose source decides the stage output
+        '''
+        try:
+            payload = {"stage": stage,
+                       "files": [self.hash_file(file_path) for file_path in input_files],
+                       "configs": [self._config_values(config) for config in configs],
+                       "code": [hashlib.sha256(inspect.getsource(obj).encode()).hexdigest() for obj in code]}
+            return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+        except Exception as e:
+            raise USvisaException(str(e), sys)
+
+    def _entry_path(self, stage: str, fingerprint: str) -> str:
+        return os.path.join(self.stage_cache_config.stage_cache_dir, stage, f"{fingerprint}.pkl")
+
+    @staticmethod
+    def _artifact_files(artifact: object) -> List[str]:
+        paths = []
+        for artifact_field in fields(artifact):
+            value = getattr(artifact, artifact_field.name)
+            if is_dataclass(value):
+                paths.extend(StageCache._artifact_files(value))
+            elif isinstance(value, str) and artifact_field.name.endswith("file_path"):
+                paths.append(value)
+        return paths
+
+    def load(self, stage: str, fingerprint: str) -> Optional[object]:
+        '''
+        Returns the cached artifact of the stage, None when there is no usable entry
+        '''
+        try:
+            if not self.stage_cache_config.enabled:
+                return None
+
+            entry_path = self._entry_path(stage, fingerprint)
+            if not os.path.exists(entry_path):
+                return None
+
+            artifact = load_object(file_path=entry_path)
+            if not all(os.path.exists(path) for path in self._artifact_files(artifact)):
+                logging.info(f"Stage cache entry of {stage} points to deleted artifacts, recomputing")
+                return None
+
+            logging.info(f"Reusing cached {stage} artifact {fingerprint[:12]}")
+            return artifact
+
+        except Exception as e:
+            raise USvisaException(str(e), sys)
+
+    def save(self, stage: str, fingerprint: str, artifact: object) -> None:
+        try:
+            if self.stage_cache_config.enabled:
+                save_object(file_path=self._entry_path(stage, fingerprint), obj=artifact)
+
+        except Exception as e:
+            raise USvisaException(str(e), sys)
@@ -0,0 +1,94 @@
+import sys
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Sequence
+
+from us_visa.exception.exceptions import USvisaException
+from us_visa.logger.logger import logging
+
+
+def run_inline(fn: Callable, *args, **kwargs) -> Future:
+    '''
+    Runs fn at once and returns its outcome as a finished future, the default for components run outside a graph
+    '''
+    future = Future()
+    try:
+        future.set_result(fn(*args, **kwargs))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+class StageGraph:
+    '''
+    Runs pipeline stages as a dependency graph on a thread pool.
+    A stage starts as soon as every stage it depends on has finished and receives their results as keyword
+    arguments named after them, so independent work (s3 downloads, report writes) overlaps the critical path.
+    Stages can also hand work to background(), which has its own threads so a stage may wait on it,
+    run() waits for all of it before returning
+    '''
+
+    def __init__(self, max_workers: int, background_workers: int):
+        self.max_workers = max_workers
+        self.background_workers = background_workers
+        self._stages: Dict[str, tuple] = {}
+        self._background_executor: Optional[ThreadPoolExecutor] = None
+        self._background: List[Future] = []
+
+    def add(self, name: str, fn: Callable, depends_on: Sequence[str] = ()) -> None:
+        unknown = [dependency for dependency in depends_on if dependency not in self._stages]
+        if unknown:
+            raise ValueError(f"Stage {name} depends on unknown stages {unknown}, add stages after their dependencies")
+        self._stages[name] = (fn, tuple(depends_on))
+
+    def background(self, fn: Callable, *args, **kwargs) -> Future:
+        '''
+        Submits work off the stage threads, inline when the graph is not running
+        '''
+        if self._background_executor is None:
+            return run_inline(fn, *args, **kwargs)
+        future = self._background_executor.submit(fn, *args, **kwargs)
+        self._background.append(future)
+        return future
+
+    def run(self) -> Dict[str, object]:
+        '''
+        Runs every stage and returns their results by name
+
+        Output      :   dict of stage name to stage result
+        On Failure  :   Pending stages are cancelled, running ones finish, then the first error is raised
+        '''
+        results: Dict[str, object] = {}
+        running: Dict[Future, str] = {}
+        pending = dict(self._stages)
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pipeline-stage") as executor, \
+                 ThreadPoolExecutor(max_workers=self.background_workers, thread_name_prefix="pipeline-background") as background:
+                self._background_executor = background
+                try:
+                    while pending or running:
+                        for name, (fn, depends_on) in list(pending.items()):
+                            if all(dependency in results for dependency in depends_on):
+                                logging.info(f"Starting stage {name}")
+                                running[executor.submit(fn, **{dependency: results[dependency] for dependency in depends_on})] = name
+                                del pending[name]
+
+                        done, _ = wait(running, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            name = running.pop(future)
+                            # the first failure stops the graph, stages that depend on it never start
+                            results[name] = future.result()
+                            logging.info(f"Finished stage {name}")
+
+                    for future in self._background:
+                        future.result()
+                finally:
+                    for future in running:
+                        future.cancel()
+                    self._background_executor = None
+                    self._background = []
+
+            return results
+
+        except Exception as e:
+            raise USvisaException(str(e), sys)
@@ -1,5 +1,6 @@
 import os 
 import sys 
+from typing import Optional
 
 from us_visa.exception.exceptions import USvisaException
 from us_visa.logger.logger import logging
@@ -8,10 +9,21 @@ from us_visa.components.data_ingestion import DataIngestion
 from us_visa.components.data_validation import DataValidation
 from us_visa.components.data_transformation import DataTransformation
 from us_visa.components.model_trainer import ModelTrainer
-from us_visa.components.model_evaluation import ModelEvaluation
+from us_visa.components.model_evaluation import ModelEvaluation,NOT_PREFETCHED
 from us_visa.components.model_pusher import ModelPusher
 
-from us_visa.entity.config_entity import (DataIngestionConfig,
+from us_visa.entity.estimator import UsVisaModel
+from us_visa.entity.s3_estimator import USvisaEstimator
+from us_visa.entity.tree_ensemble import FlatTreeEnsemble
+from us_visa.entity.feature_spec import FeatureSpec
+from us_visa.monitoring.drift_monitor import build_reference_profile
+from us_visa.pipeline.stage_cache import StageCache
+from us_visa.pipeline.stage_graph import StageGraph
+from us_visa.constants.constant import SCHEMA_FILE_PATH
+from us_visa.utils.main_utils import read_yaml_file
+
+from us_visa.entity.config_entity import (TrainingPipelineConfig,
+                                          DataIngestionConfig,
                                           DataValidationConfig,
                                           DataTransformationConfig,
                                           ModelTrainerConfig,
@@ -28,12 +40,16 @@ from us_visa.entity.artifact_entity import (DataIngestionArtifact,
 
 class TrainingPipeline:
     def __init__(self):
+        self.training_pipeline_config = TrainingPipelineConfig()
         self.data_ingestion_config = DataIngestionConfig()
         self.data_validation_config = DataValidationConfig()
         self.data_transformation_config = DataTransformationConfig()  
         self.model_trainer_config = ModelTrainerConfig()  
         self.model_evaluation_config = ModelEvaluationConfig()
         self.model_pusher_config = ModelPusherConfig()
+        self.stage_cache = StageCache()
+        self.stage_graph = StageGraph(max_workers=self.training_pipeline_config.max_workers,
+                                      background_workers=self.training_pipeline_config.background_workers)
 
     def start_data_ingestion(self) -> DataIngestionArtifact:
         try:
@@ -52,11 +68,23 @@ class TrainingPipeline:
         '''
 
         try:
+            fingerprint = self.stage_cache.fingerprint(stage="data_validation",
+                                                       input_files=[data_ingestion_artifact.trained_file_path,
+                                                                    data_ingestion_artifact.test_file_path,
+                                                                    SCHEMA_FILE_PATH],
+                                                       configs=[self.data_validation_config],
+                                                       code=[DataValidation])
+            data_validation_artifact = self.stage_cache.load("data_validation",fingerprint)
+            if data_validation_artifact is not None:
+                return data_validation_artifact
+
             data_validation = DataValidation(data_ingestion_artifact=data_ingestion_artifact,
-                                             data_validation_config=self.data_validation_config)
+                                             data_validation_config=self.data_validation_config,
+                                             background=self.stage_graph.background)
             
             data_validation_artifact = data_validation.initiate_data_validation()
             logging.info("Performed data validation operation")
+            self.stage_cache.save("data_validation",fingerprint,data_validation_artifact)
             
             return data_validation_artifact
         except Exception as e:
@@ -66,11 +94,27 @@ class TrainingPipeline:
                                   data_ingestion_artifact: DataIngestionArtifact,
                                   data_validation_artifact: DataValidationArtifact) -> DataTransformationArtifact:
         try:
+            # only the resampling section of model.yaml feeds this stage, model search tweaks keep the cache valid
+            resampling_config = read_yaml_file(self.data_transformation_config.model_config_file_path).get("resampling",{})
+            fingerprint = self.stage_cache.fingerprint(stage="data_transformation",
+                                                       input_files=[data_ingestion_artifact.trained_file_path,
+                                                                    data_ingestion_artifact.test_file_path,
+                                                                    SCHEMA_FILE_PATH],
+                                                       configs=[self.data_transformation_config,
+                                                                resampling_config,
+                                                                {"validation_status": data_validation_artifact.validation_status}],
+                                                       code=[DataTransformation,build_reference_profile,FeatureSpec])
+            data_transformation_artifact = self.stage_cache.load("data_transformation",fingerprint)
+            if data_transformation_artifact is not None:
+                return data_transformation_artifact
+
             data_transformation = DataTransformation(data_ingestion_artifact=data_ingestion_artifact,
                                                      data_transformation_config=self.data_transformation_config,
-                                                     data_validation_artifact=data_validation_artifact)
+                                                     data_validation_artifact=data_validation_artifact,
+                                                     background=self.stage_graph.background)
             
             data_transformation_artifact = data_transformation.initiate_data_transformation()
+            self.stage_cache.save("data_transformation",fingerprint,data_transformation_artifact)
             return data_transformation_artifact
         
         except Exception as e:
@@ -79,20 +123,43 @@ class TrainingPipeline:
     def start_model_trainer_pipeline(self,
                                      data_transformation_artifact: DataTransformationArtifact) -> ModelTrainerArtifact:
         try:
+            fingerprint = self.stage_cache.fingerprint(stage="model_trainer",
+                                                       input_files=[data_transformation_artifact.transformed_train_file_path,
+                                                                    data_transformation_artifact.transformed_test_file_path,
+                                                                    data_transformation_artifact.transformed_train_label_file_path,
+                                                                    data_transformation_artifact.transformed_test_label_file_path,
+                                                                    data_transformation_artifact.transformed_object_file_path,
+                                                                    data_transformation_artifact.reference_profile_file_path,
+                                                                    self.model_trainer_config.model_config_file_path],
+                                                       configs=[self.model_trainer_config],
+                                                       code=[ModelTrainer,UsVisaModel,FlatTreeEnsemble])
+            model_trainer_artifact = self.stage_cache.load("model_trainer",fingerprint)
+            if model_trainer_artifact is not None:
+                return model_trainer_artifact
+
             model_trainer = ModelTrainer(data_transformation_artifact=data_transformation_artifact,
                                          model_trainer_config=self.model_trainer_config)
             model_trainer_artifact = model_trainer.initiate_model_trainer()
+            self.stage_cache.save("model_trainer",fingerprint,model_trainer_artifact)
             return model_trainer_artifact
         except Exception as e:
             raise USvisaException(str(e),sys)
     
+    def start_best_model_prefetch(self) -> Optional[USvisaEstimator]:
+        try:
+            return ModelEvaluation.prefetch_best_model(self.model_evaluation_config)
+        except Exception as e:
+            raise USvisaException(str(e),sys)
+
     def start_model_evaluation_pipeline(self,
                                data_ingestion_artifact: DataIngestionArtifact,
-                               model_trainer_artifact: ModelTrainerArtifact) -> ModelEvaluationArtifact:
+                               model_trainer_artifact: ModelTrainerArtifact,
+                               best_model: Optional[USvisaEstimator] = NOT_PREFETCHED) -> ModelEvaluationArtifact:
         try:
             model_evaluation = ModelEvaluation(model_eval_config=self.model_evaluation_config,
                                                data_ingestion_artifact=data_ingestion_artifact,
-                                               model_trainer_artifact=model_trainer_artifact)
+                                               model_trainer_artifact=model_trainer_artifact,
+                                               best_model=best_model)
             
             model_evaluation_artifact = model_evaluation.initiate_model_evaluation()
             return model_evaluation_artifact
@@ -113,17 +180,23 @@ class TrainingPipeline:
     def run_pipeline(self) -> None:
         '''
         This method is responsible for running the entire pipeline
-        
+        The stages run as a dependency graph: the production model is downloaded and deserialized
+        while the new one is trained, so s3 latency stays off the critical path
         '''
 
         try:
-            data_ingestion_artifact = self.start_data_ingestion()
-            data_validation_artifact = self.start_data_validation(data_ingestion_artifact=data_ingestion_artifact)
-            data_transformation_artifact = self.start_data_transformation(data_ingestion_artifact=data_ingestion_artifact,
-                                                                          data_validation_artifact=data_validation_artifact)
-            model_trainer_artifact = self.start_model_trainer_pipeline(data_transformation_artifact=data_transformation_artifact)
-            model_evaluation_artifact = self.start_model_evaluation_pipeline(data_ingestion_artifact=data_ingestion_artifact,
-                                                                             model_trainer_artifact=model_trainer_artifact)
+            self.stage_graph.add("best_model",self.start_best_model_prefetch)
+            self.stage_graph.add("data_ingestion_artifact",self.start_data_ingestion)
+            self.stage_graph.add("data_validation_artifact",self.start_data_validation,
+                                 depends_on=["data_ingestion_artifact"])
+            self.stage_graph.add("data_transformation_artifact",self.start_data_transformation,
+                                 depends_on=["data_ingestion_artifact","data_validation_artifact"])
+            self.stage_graph.add("model_trainer_artifact",self.start_model_trainer_pipeline,
+                                 depends_on=["data_transformation_artifact"])
+            self.stage_graph.add("model_evaluation_artifact",self.start_model_evaluation_pipeline,
+                                 depends_on=["data_ingestion_artifact","model_trainer_artifact","best_model"])
+
+            model_evaluation_artifact = self.stage_graph.run()["model_evaluation_artifact"]
             
             if not model_evaluation_artifact.is_model_accepted:
                 logging.info("Model not accepted")
@@ -1,8 +1,11 @@
 import os 
 import sys  
+import gzip
+import json
 
 import numpy as np 
 import dill 
+from scipy import sparse
 import yaml 
 from pandas import DataFrame
 
@@ -33,6 +36,23 @@ def write_yaml_file(file_path:str,
         
     except Exception as e:
         raise USvisaException(str(e),sys) 
+
+def write_json_file(file_path: str,
+                    content: object,
+                    compress: bool = False) -> None:
+    try:
+        os.makedirs(os.path.dirname(file_path),exist_ok=True)
+        
+        # compressed output is meant for large machine read reports, plain output stays human readable
+        if compress:
+            with gzip.open(file_path,"wt",encoding="utf-8") as file:
+                json.dump(content,file,separators=(",",":"),default=str)
+        else:
+            with open(file_path,"w") as file:
+                json.dump(content,file,indent=2,default=str)
+    
+    except Exception as e:
+        raise USvisaException(str(e),sys) 
     
 def load_object(file_path: str) -> object:
     # logging.info("Entered the load_object method of utils")
@@ -47,10 +67,12 @@ def load_object(file_path: str) -> object:
     except Exception as e:
         raise USvisaException(str(e),sys) 
 
-def save_numpy_array_data(file_path: str,array: np.array):
+def save_numpy_array_data(file_path: str,array: np.array,dtype: str = None):
     try:
         dir_path = os.path.dirname(file_path)
         os.makedirs(dir_path,exist_ok=True)
+        # c-contiguous arrays on disk can be memory mapped without a copy on load
+        array = np.ascontiguousarray(array,dtype=dtype)
         with open(file_path,"wb") as f:
             np.save(f,array)
     
@@ -58,14 +80,40 @@ def save_numpy_array_data(file_path: str,array: np.array):
         raise USvisaException(str(e),sys)
     
 
-def load_numpy_array_data(file_path: str):
+def load_numpy_array_data(file_path: str,mmap_mode: str = None):
     try:
+        if mmap_mode is not None:
+            return np.load(file_path,mmap_mode=mmap_mode)
+        
         with open(file_path,"rb") as f:
             return np.load(f)
     
     except Exception as e:
         raise USvisaException(str(e),sys) 
 
+def save_sparse_array_data(file_path: str,array: sparse.spmatrix,dtype: str = None):
+    try:
+        os.makedirs(os.path.dirname(file_path),exist_ok=True)
+        array = sparse.csr_matrix(array,dtype=dtype)
+        sparse.save_npz(file_path,array)
+    
+    except Exception as e:
+        raise USvisaException(str(e),sys)
+    
+
+def load_feature_array_data(file_path: str,mmap_mode: str = None):
+    '''
+    Loads transformed features stored either as a sparse .npz or a dense .npy file
+    '''
+    try:
+        if file_path.endswith(".npz"):
+            return sparse.load_npz(file_path).tocsr()
+        
+        return load_numpy_array_data(file_path=file_path,mmap_mode=mmap_mode)
+    
+    except Exception as e:
+        raise USvisaException(str(e),sys)
+
 def save_object(file_path: str,obj: object):
     # logging.info("Entered the save_object() in utils")
     